@@ -25,9 +25,12 @@ app.layout = html.Div([
     ], fluid=True),
     store_data.df.store,
     store_data.fig_filename.store,
+    store_data.fig_layout.store,
     store_data.custom_symbols.store,
     store_data.selected_node.store,
     store_data.feature_explanation_df.store,
+    store_data.level_of_detail_view.store,
+    store_data.session_expired.store,
     dcc.Location(id='url')
 ], className='bg-light', style={"overflow-x": "hidden", "min-height": "100vh"})
 
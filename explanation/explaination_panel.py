@@ -38,5 +38,5 @@ explanation_row = html.Div(dbc.Row([
     Input(store_data.df.store_id, 'data')
 )
 def panel_control(data):
-    return not data['file']
+    return not data['file_id']
 
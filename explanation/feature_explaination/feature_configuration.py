@@ -1,7 +1,6 @@
 from dash import html, dcc, Input, Output, State
 import dash_bootstrap_components as dbc
-from utility import callback_manager, store_data, attributes, data_preprocessing
-import pandas as pd
+from utility import callback_manager, store_data, attributes, data_preprocessing, tree_session, feature_matrix
 
 manager = callback_manager.CallbackManager()
 
@@ -67,7 +66,7 @@ def feature_column_name_reset(is_hidden, data):
     if is_hidden:
         return [], None
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     feature_attributes = attributes.get_numerical_json_type_attributes(df)
     feature_value = feature_attributes[0]
@@ -112,7 +111,7 @@ def exclude_action_config_update(is_hidden, data):
     if is_hidden:
         return [], None
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     children = data_preprocessing.get_root_available_actions(df)
     best_action = data_preprocessing.get_root_best_action(df)
@@ -139,9 +138,9 @@ def path_exclude_features_reset(feature_col, data):
     if feature_col is None:
         return [], None
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
     root_node_name = data_preprocessing.get_root_node_name(df)
 
-    features = data_preprocessing.get_features(df, root_node_name, feature_col=feature_col)
+    features = feature_matrix.get_feature_matrix(df, feature_col).get_features(root_node_name)
     features = [{"label": str(feature), "value": feature} for feature in features]
     return features, []
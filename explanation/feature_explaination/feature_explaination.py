@@ -1,8 +1,7 @@
 from dash import html, Input, Output, State, dcc
 import dash_bootstrap_components as dbc
-from utility import callback_manager, store_data, data_preprocessing, feature_explanation_generator
+from utility import callback_manager, store_data, data_preprocessing, feature_explanation_generator, tree_session
 import pandas as pd
-from utility import feature_explaination_helper_function
 import plotly.express as px
 import plotly.graph_objects as go
 from base64 import b64encode
@@ -35,10 +34,10 @@ feature_explanation_card = dbc.Card([
     State(store_data.df.store_id, 'data')
 )
 def feature_explanation_data_update(feature_col, feature_depth, include_actions, exclude_features, change_ratio, data):
-    if feature_col is None or feature_depth is None or data['file'] is None or change_ratio is None:
-        return {"df": None, "max_depth": 0}
+    if feature_col is None or feature_depth is None or data['file_id'] is None or change_ratio is None:
+        return {"cube": None, "max_depth": 0}
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     root_action_list = data_preprocessing.get_root_available_actions(df)
     exclude_actions = []
@@ -55,15 +54,15 @@ def feature_explanation_data_update(feature_col, feature_depth, include_actions,
         exclude_actions.append(root_action)
 
     if include_actions:
-        table_df, maximum_depth = feature_explanation_generator.generate_feature_explanation_df(df, feature_depth,
-                                                                                                exclude_actions,
-                                                                                                exclude_features,
-                                                                                                feature_col,
-                                                                                                change_ratio)
+        cube, maximum_depth = feature_explanation_generator.generate_feature_explanation_cube(df, feature_depth,
+                                                                                              exclude_actions,
+                                                                                              exclude_features,
+                                                                                              feature_col,
+                                                                                              change_ratio)
 
-        return {"df": table_df.to_json(), "max_depth": maximum_depth}
+        return {"cube": cube.to_dict(), "max_depth": maximum_depth}
 
-    return {"df": None, "max_depth": 0}
+    return {"cube": None, "max_depth": 0}
 
 
 @manager.callback(
@@ -71,13 +70,14 @@ def feature_explanation_data_update(feature_col, feature_depth, include_actions,
     Input(store_data.feature_explanation_df.store_id, 'data'),
 )
 def feature_explanation_table_update(feature_explanation_df_dict):
-    table_df = feature_explanation_df_dict['df']
+    cube = feature_explanation_df_dict['cube']
     maximum_depth = feature_explanation_df_dict['max_depth'] + 1
 
-    if table_df is None:
+    if cube is None:
         return []
 
-    table_df = feature_explaination_helper_function.json_feature_table_to_df(table_df)
+    # Format the percentage and count text only for the table
+    table_df = feature_explanation_generator.FeatureExplanationCube.from_dict(cube).to_table_df()
 
     table = dbc.Table.from_dataframe(table_df, bordered=True, hover=True, index=True,
                                      responsive=True, class_name='align-middle text-center')
@@ -111,13 +111,13 @@ def feature_explanation_table_update(feature_explanation_df_dict):
     Input(store_data.feature_explanation_df.store_id, 'data'),
 )
 def feature_explanation_heatmap_update(feature_explanation_df_dict):
-    table_df = feature_explanation_df_dict['df']
+    cube = feature_explanation_df_dict['cube']
     maximum_depth = feature_explanation_df_dict['max_depth'] + 1
 
-    if table_df is None:
+    if cube is None:
         return []
 
-    table_df = feature_explaination_helper_function.json_feature_table_to_df(table_df)
+    table_df = feature_explanation_generator.FeatureExplanationCube.from_dict(cube).to_percentage_df()
 
     action_names = table_df.columns.get_level_values(0)
     actions_dict = {}
@@ -128,7 +128,6 @@ def feature_explanation_heatmap_update(feature_explanation_df_dict):
 
         actions_dict[action] = {}
         action_features_df = table_df[action].T
-        action_features_df = action_features_df.applymap(lambda x: float(x.split("%")[0]) if x else None)
 
         for i in range(maximum_depth):
             if i == 0:
@@ -165,11 +164,11 @@ def feature_explanation_heatmap_update(feature_explanation_df_dict):
     Input(store_data.feature_explanation_df.store_id, 'data'),
 )
 def feature_explanation_text_update(feature_explanation_df_dict):
-    feature_df = feature_explanation_df_dict['df']
+    cube = feature_explanation_df_dict['cube']
 
-    if feature_df is None:
+    if cube is None:
         return []
 
-    feature_df = feature_explaination_helper_function.json_feature_table_to_df(feature_df)
+    feature_df = feature_explanation_generator.FeatureExplanationCube.from_dict(cube).to_percentage_df()
 
     return feature_explanation_generator.generate_text_explanation(feature_df)
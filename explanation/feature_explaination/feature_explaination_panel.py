@@ -1,7 +1,6 @@
 from dash import html, Input, Output
 import dash_bootstrap_components as dbc
-from utility import callback_manager, store_data, attributes
-import pandas as pd
+from utility import callback_manager, store_data, attributes, tree_session
 from explanation.feature_explaination import feature_configuration, feature_explaination
 
 manager = callback_manager.CallbackManager()
@@ -35,10 +34,10 @@ feature_explanation_contents = html.Div([
     Input(store_data.df.store_id, 'data')
 )
 def panel_control(data):
-    if not data['file']:
+    if not data['file_id']:
         return True, True
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     path_attributes = attributes.get_numerical_json_type_attributes(df)
 
@@ -1,7 +1,6 @@
 from dash import html, dcc, Input, Output, State
 import dash_bootstrap_components as dbc
-from utility import callback_manager, store_data, attributes, data_preprocessing
-import pandas as pd
+from utility import callback_manager, store_data, attributes, data_preprocessing, tree_session, feature_matrix
 
 manager = callback_manager.CallbackManager()
 
@@ -60,7 +59,7 @@ def feature_column_name_reset(is_hidden, data):
     if is_hidden:
         return [], None
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     path_attributes = attributes.get_numerical_json_type_attributes(df)
     path_value = path_attributes[0]
@@ -102,7 +101,7 @@ def update_action_name_config(is_hidden, data):
     if is_hidden:
         return [], None
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
     best_action = data_preprocessing.get_root_best_action(df)
 
     children = data_preprocessing.get_root_available_actions(df, [best_action], 'Action_Name')
@@ -122,10 +121,10 @@ def path_exclude_features_reset(feature_col, data):
     if feature_col is None:
         return [], None
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
     root_node_name = data_preprocessing.get_root_node_name(df)
 
-    features = data_preprocessing.get_features(df, root_node_name, feature_col=feature_col)
+    features = feature_matrix.get_feature_matrix(df, feature_col).get_features(root_node_name)
     features = [{"label": str(feature), "value": feature} for feature in features]
     return features, []
 
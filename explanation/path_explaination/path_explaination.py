@@ -1,7 +1,6 @@
 from dash import html, dcc, Input, Output, State
 import dash_bootstrap_components as dbc
-from utility import callback_manager, store_data, path_explanation_generator
-import pandas as pd
+from utility import callback_manager, store_data, path_explanation_generator, tree_session
 
 manager = callback_manager.CallbackManager()
 
@@ -26,15 +25,18 @@ path_explanation_card = dbc.Card([
     State(store_data.df.store_id, 'data')
 )
 def path_explanation_update(feature_col, path_type, action_name, exclude_features, data):
-    if feature_col is None or path_type is None or data['file'] is None:
+    if feature_col is None or path_type is None or data['file_id'] is None:
         return None
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     explanations = []
 
     if path_type == 'Best path vs Worse path':
         explanations = path_explanation_generator.explanation_by_paths(df, feature_col, exclude_features)
+        # Summarise several strong lines of the best action, not only the single best path
+        explanations += path_explanation_generator.top_k_explanation_by_paths(df, state_col=feature_col,
+                                                                              exclude_features=exclude_features)
     elif path_type == 'Best action vs Second best action':
         explanations = path_explanation_generator.counterfactual_explanation_by_paths(df, None, exclude_features,
                                                                                       feature_col)
@@ -1,8 +1,7 @@
 from dash import html, Input, Output
 import dash_bootstrap_components as dbc
-from utility import callback_manager, store_data, attributes
+from utility import callback_manager, store_data, attributes, tree_session
 from explanation.path_explaination import path_configuration, path_explaination
-import pandas as pd
 
 manager = callback_manager.CallbackManager()
 manager += path_configuration.manager
@@ -40,10 +39,10 @@ path_explanation_contents = html.Div([
     Input(store_data.df.store_id, 'data')
 )
 def panel_control(data):
-    if not data['file']:
+    if not data['file_id']:
         return True, True
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     path_attributes = attributes.get_numerical_json_type_attributes(df)
 
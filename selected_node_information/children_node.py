@@ -1,7 +1,6 @@
 import dash_bootstrap_components as dbc
 from dash import html, Output, Input, State
-from utility import callback_manager, store_data, data_preprocessing
-import pandas as pd
+from utility import callback_manager, store_data, data_preprocessing, tree_session
 
 
 manager = callback_manager.CallbackManager()
@@ -30,7 +29,7 @@ def update_children_button_list(selected_node, data, visit_threshold):
         return ""
 
     children_buttons = []
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     if not visit_threshold:
         visit_threshold = 1
@@ -1,8 +1,7 @@
 import dash_bootstrap_components as dbc
 from dash import html, Output, Input, State
-from utility import callback_manager, store_data
+from utility import callback_manager, store_data, tree_session
 from utility.attributes import get_attributes, get_json_type_attributes
-import pandas as pd
 import json
 
 manager = callback_manager.CallbackManager()
@@ -54,7 +53,7 @@ def update_node_information(selected_node, data):
         return ""
 
     accordion = dbc.Accordion([], always_open=True, active_item=[])
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
     attributes = get_attributes(df)
 
     for attribute in attributes:
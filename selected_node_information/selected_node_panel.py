@@ -1,6 +1,6 @@
 from dash import html, Output, Input, ALL, ctx, State
 import dash_bootstrap_components as dbc
-from utility import callback_manager, store_data, tree_graph_generator
+from utility import callback_manager, store_data, tree_graph_generator, tree_session
 from selected_node_information import detail, children_node, similar_nodes_panel, image
 from dash._utils import AttributeDict
 
@@ -76,10 +76,10 @@ def col_size_change(data):
     Input({'type': 'game_feature_button', 'index': ALL}, 'n_clicks'),
     Input({'type': 'children_action_button', 'index': ALL}, 'n_clicks'),
     State(store_data.selected_node.store_id, 'data'),
-    State('tree_visualisation_graph', 'figure')
+    State(store_data.df.store_id, 'data')
 )
 def selected_node_store_update(click_data, children_buttons, feature_buttons,
-                               children_action_buttons, selected_node, fig):
+                               children_action_buttons, selected_node, data):
     if ctx.triggered_id == "tree_visualisation_graph":
         if not click_data:
             return None
@@ -87,15 +87,19 @@ def selected_node_store_update(click_data, children_buttons, feature_buttons,
         if 'customdata' not in click_data['points'][0]:
             return None
 
-        return click_data['points'][0]['customdata']
+        df = tree_session.get_dataframe(data)
+        return tree_graph_generator.resolve_custom_data(df, click_data['points'][0]['customdata'])
 
     if type(ctx.triggered_id) == AttributeDict:
         if ctx.triggered_id['type'] == 'children_button' and 1 in children_buttons:
-            return tree_graph_generator.get_figure_custom_data_by_node_name(fig, ctx.triggered_id['index'])
+            return tree_graph_generator.get_figure_custom_data_by_node_name(tree_session.get_dataframe(data),
+                                                                            ctx.triggered_id['index'])
         elif ctx.triggered_id['type'] == 'game_feature_button' and 1 in feature_buttons:
-            return tree_graph_generator.get_figure_custom_data_by_node_name(fig, ctx.triggered_id['index'])
+            return tree_graph_generator.get_figure_custom_data_by_node_name(tree_session.get_dataframe(data),
+                                                                            ctx.triggered_id['index'])
         elif ctx.triggered_id['type'] == 'children_action_button' and 1 in children_action_buttons:
-            return tree_graph_generator.get_figure_custom_data_by_node_name(fig, ctx.triggered_id['index'])
+            return tree_graph_generator.get_figure_custom_data_by_node_name(tree_session.get_dataframe(data),
+                                                                            ctx.triggered_id['index'])
 
     return selected_node
 
@@ -1,7 +1,7 @@
 from dash import html, Output, Input, State
 import dash_bootstrap_components as dbc
-from utility import callback_manager, similarity, store_data, attributes, data_preprocessing
-import pandas as pd
+from utility import callback_manager, similarity, store_data, attributes, data_preprocessing, tree_session, \
+    child_action_sets
 
 manager = callback_manager.CallbackManager()
 
@@ -17,11 +17,18 @@ children_action_similarity_function = dbc.Select(
 children_action_similarity_textbox = dbc.Input(type='number', id='children_action_similarity_threshold',
                                                value=1, min=0, max=1)
 
+children_action_similarity_mode = dbc.Select(
+    id='children_action_similarity_mode',
+    options=[{'label': label, 'value': mode} for mode, label in child_action_sets.SEARCH_MODES.items()],
+    value='exact'
+)
+
 similar_nodes_children_action_accordion = html.Div([
     dbc.Accordion([
         dbc.AccordionItem([
             "Similarity Function", children_action_similarity_function,
-            "Similarity Threshold", children_action_similarity_textbox
+            "Similarity Threshold", children_action_similarity_textbox,
+            "Search Mode", children_action_similarity_mode
         ], id='similar_children_action_configuration', title='Configuration'),
         dbc.AccordionItem(id='similar_children_action_content', title='Nodes'),
     ], always_open=True, active_item=['item-0', 'item-1'], id='similar_children_action_accordion')
@@ -48,7 +55,7 @@ def children_layout_update(selected_node, df):
     if not selected_node:
         return True, True
 
-    df = pd.read_json(df['file'])
+    df = tree_session.get_dataframe(df)
 
     if 'Action_Name' not in attributes.get_attributes(df):
         return True, False
@@ -84,12 +91,13 @@ def children_accordion_reset(_):
     Output('similar_children_action_content', 'children'),
     Input('children_action_similarity_function', 'value'),
     Input('children_action_similarity_threshold', 'value'),
+    Input('children_action_similarity_mode', 'value'),
     Input('similar_nodes_game_features_accordion', 'hidden'),
     State(store_data.selected_node.store_id, 'data'),
     State(store_data.df.store_id, 'data'),
     State('visit_threshold', 'value')
 )
-def update_node_similar_game_feature_content(similarity_method, similarity_threshold, is_hidden,
+def update_node_similar_game_feature_content(similarity_method, similarity_threshold, search_mode, is_hidden,
                                              selected_node, data, visit_threshold):
     if is_hidden:
         return None
@@ -97,7 +105,7 @@ def update_node_similar_game_feature_content(similarity_method, similarity_thres
     if similarity_method is None or similarity_threshold is None:
         return None
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     if not visit_threshold:
         visit_threshold = 1
@@ -105,7 +113,8 @@ def update_node_similar_game_feature_content(similarity_method, similarity_thres
     similar_nodes_by_children_action = data_preprocessing.search_similar_node_by_children_action(df, visit_threshold,
                                                                                                  selected_node['Name'],
                                                                                                  similarity_method,
-                                                                                                 similarity_threshold)
+                                                                                                 similarity_threshold,
+                                                                                                 search_mode)
 
     similar_nodes = []
     for children in similar_nodes_by_children_action:
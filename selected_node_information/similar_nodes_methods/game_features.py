@@ -1,7 +1,7 @@
 from dash import html, Output, Input, State, dcc
 import dash_bootstrap_components as dbc
-from utility import callback_manager, similarity, store_data, attributes, data_preprocessing
-import pandas as pd
+from utility import callback_manager, similarity, store_data, attributes, data_preprocessing, tree_session, \
+    feature_matrix
 
 manager = callback_manager.CallbackManager()
 
@@ -47,7 +47,7 @@ def game_feature_layout_update(selected_node, df):
     if not selected_node:
         return True, None
 
-    df = pd.read_json(df['file'])
+    df = tree_session.get_dataframe(df)
 
     if 'Game_Features' not in attributes.get_attributes(df):
         return True, dbc.Alert("Not Available. Required Game_Features column", color="info")
@@ -89,17 +89,15 @@ def game_feature_accordion_reset(_):
     State(store_data.df.store_id, 'data')
 )
 def game_feature_exclude_reset(is_hidden, data):
-    if is_hidden or not data['file']:
+    if is_hidden or not data['file_id']:
         return [], []
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     if 'Game_Features' not in attributes.get_attributes(df):
         return [], []
 
-    root_name = data_preprocessing.get_root_node_name(df)
-
-    return list(data_preprocessing.get_features(df, root_name).keys()), []
+    return feature_matrix.get_feature_matrix(df).feature_names, []
 
 
 @manager.callback(
@@ -120,7 +118,7 @@ def update_node_similar_game_feature_content(similarity_method, similarity_thres
     if similarity_method is None or similarity_threshold is None:
         return None
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     if not visit_threshold:
         visit_threshold = 1
@@ -1,10 +1,8 @@
-import io
 import base64
 import os
-import random
-import pandas as pd
-from utility import store_data, callback_manager, data_preprocessing, attributes
-from dash import html, dcc, Input, Output, State, ALL, ctx
+from utility import store_data, callback_manager, data_preprocessing, attributes, tree_session, file_reader, \
+    tree_index, tree_layout, tree_graph_generator, visit_index, level_of_detail, feature_matrix
+from dash import html, dcc, Input, Output, State, ALL, ctx, no_update
 import dash_bootstrap_components as dbc
 
 manager = callback_manager.CallbackManager()
@@ -15,6 +13,9 @@ CUSTOM_SYMBOL_LIST = ['circle-open', 'circle-dot', 'circle-open-dot',
                       'x', 'x-open', 'x-dot', 'x-open-dot',
                       'star', 'star-open', 'star-dot', 'star-open-dot']
 
+# How often the browser checks that its tree is still loaded on the server
+SESSION_CHECK_INTERVAL = 10 * 1000
+
 ###############################################
 # Layout
 ###############################################
@@ -24,12 +25,13 @@ upload_file_layout = html.Div([
         dbc.Button('Upload File', outline=True, color='primary', className='mb-2', id='upload_file_button'),
         dbc.Popover([
             dbc.PopoverHeader('MCTS File Requirement', class_name='bg-info'),
-            dbc.PopoverBody('The MCTS file needs to be a csv file and seperated by "\\t". The file also needs to ' +
-                            'have following columns at least: Name, Parent_Name, Depth, Value, Visit, Action_Name and '
-                            'Best_Action')
+            dbc.PopoverBody('The MCTS file needs to be a csv file and seperated by "\\t", or a Parquet, Feather or '
+                            'Arrow IPC file. The file also needs to have following columns at least: Name, '
+                            'Parent_Name, Depth, Value, Visit, Action_Name and Best_Action')
         ], target='upload_data_button', trigger='hover')
     ], id='upload_file_upload'),
     html.Div(id='upload_file_output'),
+    dcc.Interval(id='session_check_interval', interval=SESSION_CHECK_INTERVAL)
 ], className='py-1')
 
 hover_text_layout = html.Div([
@@ -53,6 +55,50 @@ visit_threshold_layout = html.Div([
     dbc.FormText('Type number between 1 to 20', id='visit_threshold_form_text')
 ], className='py-1')
 
+max_nodes_layout = html.Div([
+    dbc.Label('Maximum Nodes', html_for='max_nodes', class_name='mb-1'),
+    dbc.Input(id='max_nodes', min=1, value=tree_graph_generator.DEFAULT_MAX_NODES, step=1, type='number'),
+    dbc.FormText('The visit threshold is raised (or subtrees are collapsed in level of detail mode) until the tree '
+                 'has fewer nodes than this number')
+], className='py-1')
+
+view_mode_layout = html.Div([
+    dbc.Label('View Mode', html_for='view_mode', class_name='mb-1'),
+    dbc.Select(id='view_mode', options=[{'label': label, 'value': mode} for mode, label in
+                                        level_of_detail.VIEW_MODES.items()], value='threshold'),
+    dbc.Popover([
+        dbc.PopoverHeader('View Mode', class_name='bg-info'),
+        dbc.PopoverBody('Visit Threshold mode hides the nodes visited less than the minimum visit threshold. Level of '
+                        'Detail mode collapses the least visited subtrees into aggregate nodes (thick outline) to keep '
+                        'the maximum number of nodes. Click an aggregate node to expand it.')
+    ], target='view_mode', trigger='hover')
+], className='py-1')
+
+render_mode_layout = html.Div([
+    dbc.Label('Render Mode', html_for='render_mode', class_name='mb-1'),
+    dbc.Select(id='render_mode', options=[{'label': label, 'value': mode} for mode, label in
+                                          tree_graph_generator.RENDER_MODES.items()], value='auto'),
+    dbc.Popover([
+        dbc.PopoverHeader('Render Mode', class_name='bg-info'),
+        dbc.PopoverBody(f'WebGL keeps large trees interactive. Auto mode uses WebGL when the tree has more than '
+                        f'{tree_graph_generator.WEBGL_NODE_THRESHOLD} nodes')
+    ], target='render_mode', trigger='hover')
+], className='py-1')
+
+layout_engines = tree_layout.get_available_layout_engines()
+layout_engine_layout = html.Div([
+    dbc.Label('Layout Engine', html_for='layout_engine', class_name='mb-1'),
+    dbc.Select(id='layout_engine', options=[{'label': label, 'value': engine} for engine, label in
+                                            layout_engines.items()], value='radial'),
+    dbc.Button('Compact Layout', id='compact_layout_button', outline=True, color='primary', size='sm',
+               class_name='mt-2'),
+    dbc.Popover([
+        dbc.PopoverHeader('Compact Layout', class_name='bg-info'),
+        dbc.PopoverBody('Nodes keep their positions in the layout of the whole tree when the visit threshold changes. '
+                        'Click to lay out the drawn nodes again without the space of the hidden nodes.')
+    ], target='compact_layout_button', trigger='hover')
+], className='py-1')
+
 add_symbol_layout = dbc.Row([
     dbc.Col(dbc.Select(id='custom_symbol_attribute'), width=5, class_name='pe-1'),
     dbc.Col(dbc.Select(id='custom_symbol_selection'), width=5, class_name='ps-1'),
@@ -69,7 +115,11 @@ custom_symbols_layout = html.Div([
 node_configuration = html.Div([
     hover_text_layout,
     legend_layout,
+    max_nodes_layout,
+    view_mode_layout,
     visit_threshold_layout,
+    layout_engine_layout,
+    render_mode_layout,
     custom_symbols_layout
 ], id='node_config', hidden=True, className='py-1')
 
@@ -93,23 +143,71 @@ def hide_node_config(data):
     return data['file_id'] is None
 
 
+@manager.callback(
+    Output(store_data.session_expired.store_id, 'data'),
+    Input('session_check_interval', 'n_intervals'),
+    State(store_data.df.store_id, 'data')
+)
+def check_session(n_intervals, data):
+    # Only signal the upload when the loaded tree is evicted or the server is restarted
+    if not tree_session.is_expired(data):
+        return no_update
+
+    return data['file_id']
+
+
+def get_expired_source(file_id, pathname, contents, filename):
+    """
+    Find the file of an expired session, either the uploaded file or the file in the url, by its content hash
+    :param file_id: the id of expired session
+    :param pathname: url pathname
+    :param contents: the contents of uploaded file
+    :param filename: the name of uploaded file
+    :return: the source and the name of file, None and None if the file is not available anymore
+    """
+    candidates = []
+
+    if contents:
+        candidates.append((base64.b64decode(contents.split(',')[1]), filename))
+
+    if pathname and pathname[1:] and os.path.exists(f'data/{pathname[1:]}'):
+        candidates.append((f'data/{pathname[1:]}', pathname[1:]))
+
+    for source, name in candidates:
+        if file_reader.get_content_hash(source, name) == file_id:
+            return source, name
+
+    return None, None
+
+
 @manager.callback(
     Output('upload_file_output', 'children'),
     Output(store_data.df.store_id, 'data'),
     Input('url', 'pathname'),
     Input('upload_file_upload', 'contents'),
+    Input(store_data.session_expired.store_id, 'data'),
     State('upload_file_upload', 'filename'),
     State(store_data.df.store_id, 'data'),
     prevent_initial_call=True
 )
-def upload_file(pathname, contents, filename, original_data):
-    if ctx.triggered_id == "upload_file_upload":
+def upload_file(pathname, contents, expired_file_id, filename, original_data):
+    if ctx.triggered_id == store_data.session_expired.store_id:
+        if not expired_file_id or expired_file_id != original_data['file_id']:
+            return no_update, no_update
+
+        # The tree is not on the server anymore, read the same file again so that the panels keep working
+        source, filename = get_expired_source(expired_file_id, pathname, contents, filename)
+        if source is None:
+            alert = dbc.Alert('The tree is no longer loaded, please upload the file again!!', color='warning',
+                              dismissable=True)
+            return alert, {'file_id': None}
+
+    elif ctx.triggered_id == "upload_file_upload":
         if not contents:
             return '', original_data
 
         # Get data
-        decoded = base64.b64decode(contents.split(',')[1])
-        df = pd.read_csv(io.StringIO(decoded.decode('utf-8')), sep='\t')
+        source = base64.b64decode(contents.split(',')[1])
 
     else:
         pathname = pathname[1:]
@@ -120,22 +218,53 @@ def upload_file(pathname, contents, filename, original_data):
 
         if not os.path.exists(filepath):
             alert = dbc.Alert(f'{pathname} is not existed!!', color='danger', dismissable=True)
-            return alert, {'file_id': None, 'file': None}
+            return alert, {'file_id': None}
 
-        # Get data
-        df = pd.read_csv(filepath, sep='\t')
+        source = filepath
         filename = pathname
 
+    # The same content always gets the same id, so a tree that is already loaded is not read again
+    file_id = file_reader.get_content_hash(source, filename)
+
+    if tree_session.sessions.touch(file_id):
+        alert = dbc.Alert(f'{filename} has uploaded successfully!!', color='success', dismissable=True)
+        return alert, {'file_id': file_id}
+
+    try:
+        # Check the compulsory columns before reading the data
+        if not data_preprocessing.check_columns_validity(file_reader.get_column_names(source, filename)):
+            alert = dbc.Alert(f'{filename} is invalid!!', color='danger', dismissable=True)
+            return alert, {'file_id': None}
+
+        # The feature matrices of nested columns are built while reading, so their json text is never decoded
+        feature_matrices = {}
+        df = file_reader.read_mcts_file(source, filename, feature_matrices)
+    except ImportError:
+        alert = dbc.Alert(f'pyarrow is required to read {filename}!!', color='danger', dismissable=True)
+        return alert, {'file_id': None}
+    except (ValueError, OSError):
+        # The file cannot be parsed (e.g. corrupt Parquet or Feather, pyarrow.ArrowInvalid is a ValueError)
+        alert = dbc.Alert(f'{filename} is invalid!!', color='danger', dismissable=True)
+        return alert, {'file_id': None}
+
     # Check the data validity.
     if not data_preprocessing.check_df_validity(df):
         alert = dbc.Alert(f'{filename} is invalid!!', color='danger', dismissable=True)
-        return alert, {'file_id': None, 'file': None}
+        return alert, {'file_id': None}
+
+    # Check the tree structure before any tree index is built
+    structure_error = tree_index.get_structure_error(df)
+    if structure_error:
+        alert = dbc.Alert(f'{filename} is invalid, {structure_error}!!', color='danger', dismissable=True)
+        return alert, {'file_id': None}
 
-    # Create a unique filename
-    file_id = f'{filename}_{random.randint(0, 999999):06d}'
+    # Keep the dataframe on the server, the browser only holds its id
+    tree_session.sessions.add(file_id, df)
+    for feature_col, features in feature_matrices.items():
+        feature_matrix.set_feature_matrix(df, features, feature_col)
 
     alert = dbc.Alert(f'{filename} has uploaded successfully!!', color='success', dismissable=True)
-    return alert, {'file_id': file_id, 'file': df.to_json()}
+    return alert, {'file_id': file_id}
 
 
 @manager.callback(
@@ -146,11 +275,11 @@ def upload_file(pathname, contents, filename, original_data):
 )
 def hover_text_update(is_hidden, data):
     # If the configuration is hidden or there is no data, set the options and value to None
-    if is_hidden or not data['file']:
+    if is_hidden or not data['file_id']:
         return [], None
 
     # Load the dataframe
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     # Get the attribute list and add it to hover_options
     attribute_list = attributes.get_attributes(df)
@@ -167,11 +296,11 @@ def hover_text_update(is_hidden, data):
 )
 def legend_select_update(is_hidden, data):
     # If the configuration is hidden or there is no data, set the options and value to None
-    if is_hidden or not data['file']:
+    if is_hidden or not data['file_id']:
         return [], None
 
     # Load the dataframe
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     # Get the legend attribute list and add it to legend options
     legend_attributes, _ = attributes.get_legend_attributes(df)
@@ -185,24 +314,24 @@ def legend_select_update(is_hidden, data):
     Output('visit_threshold', 'max'),
     Output('visit_threshold', 'value'),
     Input('node_config', 'hidden'),
+    Input('max_nodes', 'value'),
     State(store_data.df.store_id, 'data')
 )
-def visit_threshold_input_update(is_hidden, data):
+def visit_threshold_input_update(is_hidden, max_nodes, data):
     # If the configuration is hidden or there is no data, set the options and value to None
-    if is_hidden or not data['file']:
+    if is_hidden or not data['file_id']:
         return 1, 1, 1
 
     # Load the dataframe
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
-    visit_minimum = 1
+    if not max_nodes:
+        max_nodes = tree_graph_generator.DEFAULT_MAX_NODES
 
-    while df.shape[0] > 500:
-        visit_minimum += 1
-        df = df[df['Visits'] >= visit_minimum]
-
-    # Find the maximum value
-    visit_maximum = df['Visits'].max()
+    # Find the minimum threshold that keeps at most max_nodes nodes and the maximum value
+    index = visit_index.get_visit_index(df)
+    visit_minimum = index.get_min_threshold(max_nodes)
+    visit_maximum = index.get_max_visits(visit_minimum)
 
     return visit_minimum, visit_maximum, visit_minimum
 
@@ -210,10 +339,24 @@ def visit_threshold_input_update(is_hidden, data):
 @manager.callback(
     Output('visit_threshold_form_text', 'children'),
     Input('visit_threshold', 'min'),
-    Input('visit_threshold', 'max')
+    Input('visit_threshold', 'max'),
+    Input('visit_threshold', 'value'),
+    State('max_nodes', 'value'),
+    State(store_data.df.store_id, 'data')
 )
-def set_visit_threshold_placeholder(min_val, max_val):
-    return f'Type number between {min_val} and {max_val}. The maximum number of nodes is 500.'
+def set_visit_threshold_placeholder(min_val, max_val, visit_threshold, max_nodes, data):
+    if not max_nodes:
+        max_nodes = tree_graph_generator.DEFAULT_MAX_NODES
+
+    text = f'Type number between {min_val} and {max_val}. The maximum number of nodes is {max_nodes}.'
+
+    if visit_threshold is None or not data or not data['file_id']:
+        return text
+
+    # Count the nodes that will be highlighted by the threshold
+    node_number = visit_index.get_visit_index(tree_session.get_dataframe(data)).count_nodes(visit_threshold)
+
+    return f'{text} {node_number} nodes are visited at least {visit_threshold} times.'
 
 
 @manager.callback(
@@ -252,10 +395,10 @@ def hide_custom_symbols_div(add_custom_symbol_is_hidden, custom_symbols):
 )
 def set_add_custom_symbol_configuration(custom_symbols, data):
     # If there is no data available, set everything to None and don't show the custom symbols div
-    if not data['file']:
+    if not data['file_id']:
         return [], None, [], None, True
 
-    df = pd.read_json(data['file'])
+    df = tree_session.get_dataframe(data)
 
     # Get the list of attributes can be used as symbol
     available_attributes = attributes.get_binary_attributes(df)
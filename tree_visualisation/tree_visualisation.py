@@ -1,13 +1,14 @@
-from utility import callback_manager, store_data, tree_graph_generator
+from utility import callback_manager, store_data, tree_graph_generator, tree_session, level_of_detail
 from dash import html, dcc, Input, Output, State, ctx, no_update
 import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
-import pandas as pd
 from PIL import Image
 import base64
 import io
+import logging
 
 manager = callback_manager.CallbackManager()
+logger = logging.getLogger(__name__)
 
 ###############################################
 # Layout
@@ -31,63 +32,192 @@ tree_visualisation_div = html.Div(dbc.Card([
     Input(store_data.df.store_id, 'data')
 )
 def panel_control(data):
-    return not (data and data['file'] is not None)
+    return not (data and data['file_id'] is not None)
 
 
 @manager.callback(
     Output('tree_visualisation_graph', 'clickData'),
     Input(store_data.df.store_id, 'data'),
-    Input('visit_threshold', 'value')
+    Input('visit_threshold', 'value'),
+    Input('layout_engine', 'value'),
+    Input('render_mode', 'value'),
+    Input('view_mode', 'value')
 )
 def graph_click_data_reset(*args):
     return None
 
 
+@manager.callback(
+    Output(store_data.level_of_detail_view.store_id, 'data'),
+    Input('view_mode', 'value'),
+    Input('max_nodes', 'value'),
+    Input('tree_visualisation_graph', 'clickData'),
+    Input(store_data.df.store_id, 'data'),
+    State(store_data.level_of_detail_view.store_id, 'data')
+)
+def level_of_detail_view_update(view_mode, max_nodes, click_data, data, view_data):
+    # The view is only kept in level of detail mode
+    if view_mode != 'level_of_detail' or not data['file_id']:
+        return None if view_data else no_update
+
+    df = tree_session.get_dataframe(data)
+
+    if not max_nodes:
+        max_nodes = tree_graph_generator.DEFAULT_MAX_NODES
+
+    # Expand the clicked aggregate node in place. The click data is also reset when the view mode changes, then the
+    # view is built again.
+    if ctx.triggered_prop_ids.keys() == {'tree_visualisation_graph.clickData'}:
+        if not click_data or not get_level_of_detail_view(view_data, data):
+            return no_update
+
+        point = click_data['points'][0]
+        if not isinstance(point.get('customdata'), int):
+            return no_update
+
+        view = get_level_of_detail_view(view_data, data)
+        expanded_view = level_of_detail.expand_level_of_detail_view(df, view, point['customdata'], max_nodes)
+
+        if expanded_view is view:
+            return no_update
+        return {"file_id": data['file_id'], **expanded_view.to_dict()}
+
+    view = level_of_detail.build_level_of_detail_view(df, max_nodes)
+    return {"file_id": data['file_id'], **view.to_dict()}
+
+
+def get_level_of_detail_view(view_data, data):
+    """
+    Return the level of detail view of the current file
+    :param view_data: the data of level of detail view store
+    :param data: the data of dataframe store
+    :return: LevelOfDetailView, None if the view is not for the current file
+    """
+    if not view_data or view_data['file_id'] != data['file_id']:
+        return None
+    return level_of_detail.LevelOfDetailView.from_dict(view_data)
+
+
 # graph generation
 @manager.callback(
     Output('tree_visualisation_graph', 'figure'),
     Output('fig_filename', 'data'),
+    Output(store_data.fig_layout.store_id, 'data'),
     Input('legend', 'value'),
     Input(store_data.custom_symbols.store_id, 'data'),
     Input(store_data.selected_node.store_id, 'data'),
+    Input(store_data.level_of_detail_view.store_id, 'data'),
+    Input('compact_layout_button', 'n_clicks'),
     State('visit_threshold', 'value'),
     State('visit_threshold', 'min'),
-    State('tree_visualisation_graph', 'figure'),
+    State('layout_engine', 'value'),
+    State('render_mode', 'value'),
     State(store_data.df.store_id, 'data'),
-    State(store_data.fig_filename.store_id, 'data')
+    State(store_data.fig_filename.store_id, 'data'),
+    State(store_data.fig_layout.store_id, 'data')
 )
-def tree_visualisation_update(legend, custom_symbols, selected_node, visit_threshold, min_visit_threshold, fig, data,
-                              fig_filename):
+def tree_visualisation_update(legend, custom_symbols, selected_node, view_data, compact_clicks, visit_threshold,
+                              min_visit_threshold, layout_engine, render_mode, data, fig_filename, fig_layout):
     # If there is no file, return empty figure and set fig_filename to None
-    if not data['file']:
-        return go.Figure(), None
+    if not data['file_id']:
+        return go.Figure(), None, None
+
+    df = tree_session.get_dataframe(data)
+    view = get_level_of_detail_view(view_data, data)
+    figure_layout = {"min_visit_threshold": min_visit_threshold, "layout_engine": layout_engine,
+                     "render_mode": render_mode, "compact": False}
 
-    df = pd.read_json(data['file'])
+    # Draw the level of detail view again when it is changed, the selected node is kept highlighted. The view is
+    # often changed together with the selected node, so it is checked among all the triggered inputs.
+    if f'{store_data.level_of_detail_view.store_id}.data' in ctx.triggered_prop_ids or \
+            (view and data['file_id'] != fig_filename):
+        if not visit_threshold:
+            visit_threshold = 1
+
+        if view is None:
+            fig = tree_graph_generator.generate_visit_threshold_network(df, visit_threshold, legend, custom_symbols,
+                                                                        min_visit_threshold, layout_engine,
+                                                                        render_mode)
+        else:
+            fig = tree_graph_generator.generate_level_of_detail_network(df, view, visit_threshold, legend,
+                                                                        custom_symbols, render_mode)
+            if selected_node:
+                fig = tree_graph_generator.update_node_marker(fig, tree_graph_generator.get_highlight_marker(
+                    df, view.node_ids, selected_node['Name'], visit_threshold))
+
+        log_payload_nbytes('figure', fig)
+        return fig, data['file_id'], None if view else figure_layout
 
-    # If it is new data, change visit threshold or reset selected node because of visit threshold change,
-    # regenerate the graph
+    # Lay out the drawn nodes again only when the user asks for it
+    if ctx.triggered_id == 'compact_layout_button':
+        if view:
+            return no_update, fig_filename, fig_layout
+
+        fig = tree_graph_generator.generate_visit_threshold_network(df, visit_threshold or 1, legend, custom_symbols,
+                                                                    min_visit_threshold, layout_engine, render_mode,
+                                                                    compact=True)
+        log_payload_nbytes('figure', fig)
+        return fig, data['file_id'], {**figure_layout, "compact": True}
+
+    # If it is new data, or the selected node is reset because of visit threshold, layout or render mode change
     if data['file_id'] != fig_filename or (ctx.triggered_id == store_data.selected_node.store_id and not selected_node):
         if not visit_threshold:
             visit_threshold = 1
-        return tree_graph_generator.generate_visit_threshold_network(df, visit_threshold, legend,
-                                                                     custom_symbols,
-                                                                     min_visit_threshold), data['file_id']
+
+        # The figure already has the same nodes at the same positions (or the same level of detail view), only the
+        # markers follow the visit threshold
+        if data['file_id'] == fig_filename and \
+                (view or (fig_layout and {**fig_layout, "compact": False} == figure_layout)):
+            node_ids = view.node_ids if view else tree_graph_generator.get_figure_node_ids(df, min_visit_threshold)
+            marker = tree_graph_generator.get_opacity_marker(df, node_ids, visit_threshold)
+            if legend:
+                marker.update(tree_graph_generator.get_legend_marker(df, node_ids, legend, visit_threshold))
+
+            patched_fig = tree_graph_generator.patch_node_marker(marker)
+            log_payload_nbytes('marker patch', patched_fig)
+            return patched_fig, fig_filename, fig_layout
+
+        fig = tree_graph_generator.generate_visit_threshold_network(df, visit_threshold, legend,
+                                                                    custom_symbols,
+                                                                    min_visit_threshold,
+                                                                    layout_engine,
+                                                                    render_mode)
+        log_payload_nbytes('figure', fig)
+        return fig, data['file_id'], figure_layout
+
+    # The other updates only change the marker properties of the nodes on the figure
+    node_ids = view.node_ids if view else tree_graph_generator.get_figure_node_ids(df, min_visit_threshold)
 
     # Update the selected_node
     if ctx.triggered_id == store_data.selected_node.store_id and selected_node:
         if not visit_threshold:
             visit_threshold = min_visit_threshold
-        return tree_graph_generator.highlight_selected_node(fig, df, selected_node['Name'], visit_threshold), fig_filename
+        marker = tree_graph_generator.get_highlight_marker(df, node_ids, selected_node['Name'], visit_threshold)
 
     # Update the legend
-    if ctx.triggered_id == "legend":
-        return tree_graph_generator.update_legend(fig, df, legend, visit_threshold), fig_filename
+    elif ctx.triggered_id == "legend":
+        marker = tree_graph_generator.get_legend_marker(df, node_ids, legend, visit_threshold)
 
     # Update the custom symbols
-    if ctx.triggered_id == store_data.custom_symbols.store_id:
-        return tree_graph_generator.update_marker_symbols(fig, custom_symbols), fig_filename
+    elif ctx.triggered_id == store_data.custom_symbols.store_id:
+        marker = tree_graph_generator.get_symbol_marker(df, node_ids, custom_symbols)
+
+    else:
+        return no_update, fig_filename, fig_layout
+
+    patched_fig = tree_graph_generator.patch_node_marker(marker)
+    log_payload_nbytes('marker patch', patched_fig)
+    return patched_fig, fig_filename, fig_layout
 
-    return fig, fig_filename
+
+def log_payload_nbytes(name, output):
+    """
+    Log the size of figure update sent to the browser
+    :param name: the name of the update
+    :param output: Figure or Patch
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('Tree visualisation %s payload: %d bytes', name, tree_graph_generator.get_payload_nbytes(output))
 
 
 @manager.callback(
@@ -97,8 +227,10 @@ def tree_visualisation_update(legend, custom_symbols, selected_node, visit_thres
     Output("tree_node_hover_text", "direction"),
     Input("tree_visualisation_graph", "hoverData"),
     State('hover_text', 'value'),
+    State(store_data.df.store_id, 'data'),
+    State(store_data.level_of_detail_view.store_id, 'data')
 )
-def graph_click_data_reset(hoverData, hover_text):
+def graph_click_data_reset(hoverData, hover_text, df_data, view_data):
     if not hoverData:
         return False, no_update, no_update, no_update
 
@@ -108,7 +240,7 @@ def graph_click_data_reset(hoverData, hover_text):
     if 'customdata' not in pt:
         return False, no_update, no_update, no_update
 
-    data = pt['customdata']
+    data = tree_graph_generator.resolve_custom_data(tree_session.get_dataframe(df_data), pt['customdata'])
 
     elements = [html.H4(f"{data['Name']}", style={"color": "darkblue", "overflow-wrap": "break-word"})]
 
@@ -124,6 +256,14 @@ def graph_click_data_reset(hoverData, hover_text):
                                        style={'overflow': 'hidden', 'white-space': 'nowrap', 'text-overflow': 'ellipsis'},
                                        className='m-0'))
 
+    # Aggregate nodes of the level of detail view also show the totals of their subtree
+    view = get_level_of_detail_view(view_data, df_data)
+    if view and isinstance(pt['customdata'], int):
+        aggregate_data = tree_graph_generator.get_aggregate_custom_data(tree_session.get_dataframe(df_data), view,
+                                                                        pt['customdata'])
+        for name, value in (aggregate_data or {}).items():
+            elements.append(html.P(f'{name}: {value}', className='m-0 fw-bold'))
+
     children = [html.Div(elements, style={'width': '500px'})]
 
     direction = 'top' if bbox['y0'] > 400 else 'right'
@@ -1,10 +1,20 @@
 from . import callback_manager
 from . import store_data
+from . import tree_session
+from . import file_reader
+from . import tree_index
+from . import visit_index
+from . import feature_matrix
+from . import feature_index
+from . import child_action_sets
 from . import data_preprocessing
 from . import attributes
+from . import layout_cache
+from . import tree_layout
+from . import level_of_detail
 from . import tree_graph_generator
 from . import similarity
+from . import principal_variation
 from . import path_explanation_generator
 from . import state
 from . import feature_explanation_generator
-from . import feature_explaination_helper_function
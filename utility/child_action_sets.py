@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+from utility import tree_session, similarity
+
+SEARCH_MODES = {
+    'exact': 'Exact',
+    'approximate': 'Approximate (MinHash)'
+}
+
+MINHASH_PERMUTATIONS = 64
+MINHASH_PRIME = 2 ** 31 - 1
+MINHASH_SEED = 0
+
+# The number of set bits of every byte value
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.int64)
+
+
+class ChildActionSets:
+    """
+    The children actions of every node as a packed bitset. Only the nodes above the visit threshold are included.
+    The keys are the node names in row order, followed by the parent names that are not nodes (e.g. 'None'),
+    the same as the children dictionary of the similar node search.
+    """
+    def __init__(self, keys, parent_codes, action_codes, action_number, visit_threshold=None):
+        self.keys = keys
+        self.key_index = {key: idx for idx, key in enumerate(keys)}
+        self.visit_threshold = visit_threshold
+
+        # The length of children action list counts the duplicate actions
+        self.lengths = np.bincount(parent_codes, minlength=len(keys))
+
+        # The unique (parent, action) pairs are sorted by parent
+        pairs = np.unique(parent_codes.astype(np.int64) * action_number + action_codes)
+        self.pair_parents = pairs // action_number
+        self.pair_actions = pairs % action_number
+        self.unique_lengths = np.bincount(self.pair_parents, minlength=len(keys))
+
+        # Only the nodes with children have a row in the bitset (and the MinHash signatures)
+        has_children = self.lengths > 0
+        self.bit_rows = np.full(len(keys), -1, dtype=np.int64)
+        self.bit_rows[has_children] = np.arange(has_children.sum())
+        self.action_number = action_number
+
+        self._bits = None
+        self._signatures = None
+
+    @classmethod
+    def from_df(cls, df, visit_threshold):
+        """
+        Build the children action sets of the nodes above the visit threshold
+        :param df: MCTS data file
+        :param visit_threshold: visit threshold
+        :return: ChildActionSets
+        """
+        df = df[df['Visits'] >= visit_threshold]
+        parents = df['Parent_Name'].to_numpy()
+        keys = pd.unique(np.concatenate([df['Name'].to_numpy(), parents]))
+
+        parent_codes = pd.Index(keys).get_indexer(parents)
+        action_codes, actions = pd.factorize(df['Action_Name'], use_na_sentinel=False)
+
+        return cls(keys, parent_codes, action_codes, max(len(actions), 1), visit_threshold)
+
+    @property
+    def nbytes(self):
+        arrays = [self.keys, self.lengths, self.pair_parents, self.pair_actions, self.unique_lengths, self.bit_rows]
+        arrays += [array for array in [self._bits, self._signatures] if array is not None]
+        return sum(array.nbytes for array in arrays)
+
+    @property
+    def bits(self):
+        """
+        The packed bitset (nodes with children x action bytes) of the exact search. It is built on first use, so the
+        approximate search never allocates it.
+        :return: 2-D numpy array of uint8
+        """
+        if self._bits is None:
+            byte_number = (self.action_number + 7) // 8
+            self._bits = np.zeros((int((self.bit_rows >= 0).sum()), byte_number), dtype=np.uint8)
+            np.bitwise_or.at(self._bits, (self.bit_rows[self.pair_parents], self.pair_actions // 8),
+                             (128 >> (self.pair_actions % 8)).astype(np.uint8))
+
+        return self._bits
+
+    def get_intersections(self, key_id):
+        """
+        Return the number of common children actions between a node and every key
+        :param key_id: the index of node in keys
+        :return: numpy array of intersection sizes
+        """
+        intersections = np.zeros(len(self.keys), dtype=np.int64)
+        bit_row = self.bit_rows[key_id]
+
+        if bit_row < 0:
+            return intersections
+
+        # Only the bytes where the node has actions can have common bits
+        columns = np.flatnonzero(self.bits[bit_row])
+        common_bits = self.bits[:, columns] & self.bits[bit_row, columns]
+        intersections[self.bit_rows >= 0] = POPCOUNT[common_bits].sum(axis=1)
+
+        return intersections
+
+    def get_signatures(self):
+        """
+        Return the MinHash signatures of the nodes with children. They are computed on first use.
+        :return: 2-D numpy array (nodes with children x permutations)
+        """
+        if self._signatures is None:
+            random_state = np.random.RandomState(MINHASH_SEED)
+            a = random_state.randint(1, MINHASH_PRIME, size=MINHASH_PERMUTATIONS).astype(np.int64)
+            b = random_state.randint(0, MINHASH_PRIME, size=MINHASH_PERMUTATIONS).astype(np.int64)
+
+            hashes = (self.pair_actions[:, None] * a + b) % MINHASH_PRIME
+            group_starts = np.flatnonzero(np.r_[True, self.pair_parents[1:] != self.pair_parents[:-1]]) \
+                if self.pair_parents.size else np.array([], dtype=np.int64)
+            self._signatures = np.minimum.reduceat(hashes, group_starts, axis=0).astype(np.uint32) \
+                if group_starts.size else np.zeros((0, MINHASH_PERMUTATIONS), dtype=np.uint32)
+
+        return self._signatures
+
+    def estimate_intersections(self, key_id):
+        """
+        Estimate the number of common children actions between a node and every key by MinHash
+        :param key_id: the index of node in keys
+        :return: numpy array of estimated intersection sizes
+        """
+        intersections = np.zeros(len(self.keys))
+        bit_row = self.bit_rows[key_id]
+
+        if bit_row < 0:
+            return intersections
+
+        signatures = self.get_signatures()
+        jaccard = (signatures == signatures[bit_row]).mean(axis=1)
+
+        # |X & Y| = J * (|X| + |Y|) / (1 + J)
+        unique_lengths = self.unique_lengths[self.bit_rows >= 0]
+        intersections[self.bit_rows >= 0] = jaccard * (self.unique_lengths[key_id] + unique_lengths) / (1 + jaccard)
+
+        return intersections
+
+    def get_similarities(self, key_id, similarity_method, mode='exact'):
+        """
+        Return the similarities between the children actions of a node and every key
+        :param key_id: the index of node in keys
+        :param similarity_method: similarity method name
+        :param mode: 'exact' or 'approximate'
+        :return: numpy array of similarities
+        """
+        if mode == 'approximate':
+            intersections = self.estimate_intersections(key_id)
+        else:
+            intersections = self.get_intersections(key_id)
+
+        return similarity.batch_set_similarity_function_dict[similarity_method](intersections,
+                                                                                 self.lengths[key_id],
+                                                                                 self.lengths)
+
+
+def get_child_action_sets(df, visit_threshold):
+    """
+    Return the children action sets of the nodes above the visit threshold. They are built on first use and
+    rebuilt when the visit threshold changes.
+    :param df: MCTS data file
+    :param visit_threshold: visit threshold
+    :return: ChildActionSets
+    """
+    child_action_sets = tree_session.get_artifact(df, 'child_action_sets',
+                                                  lambda data: ChildActionSets.from_df(data, visit_threshold))
+
+    if child_action_sets.visit_threshold != visit_threshold:
+        child_action_sets = ChildActionSets.from_df(df, visit_threshold)
+        tree_session.set_artifact(df, 'child_action_sets', child_action_sets)
+
+    return child_action_sets
@@ -1,21 +1,31 @@
 import json
-from utility import similarity
+import numpy as np
+from utility import similarity, feature_matrix, feature_index, tree_index, child_action_sets
 
 BASIC_ATTRIBUTE = ["Name", "Parent_Name", "Depth", "Value", "Visits", "Action_Name", "Best_Action"]
 
 
-def check_df_validity(df):
+def check_columns_validity(columns):
     """
-    Check if the dataframe have all the compulsory attributes
-    :param df: MCTS data file
+    Check if the column names contain all the compulsory attributes
+    :param columns: the list of column names
     :return: True or False
     """
     for attribute in BASIC_ATTRIBUTE:
-        if attribute not in df.columns:
+        if attribute not in columns:
             return False
     return True
 
 
+def check_df_validity(df):
+    """
+    Check if the dataframe have all the compulsory attributes
+    :param df: MCTS data file
+    :return: True or False
+    """
+    return check_columns_validity(df.columns)
+
+
 def get_node(df, node_name):
     """
     Get the specific node column from MCTS data file
@@ -23,7 +33,7 @@ def get_node(df, node_name):
     :param node_name: the name of node
     :return: Series
     """
-    return df[df['Name'] == node_name].iloc[0]
+    return df.iloc[tree_index.get_tree_index(df).get_id(node_name)]
 
 
 def get_root_node(df):
@@ -32,7 +42,7 @@ def get_root_node(df):
     :param df: MCTS data file
     :return: Root node Series
     """
-    return df[df['Parent_Name'] == 'None'].iloc[0]
+    return df.iloc[tree_index.get_tree_index(df).root]
 
 
 def get_root_node_name(df):
@@ -54,12 +64,18 @@ def get_node_available_actions(df, node_name, exclude_actions=None, ref_col='Nam
     :param ref_col: the column name used for getting available actions (It needs to be unique for different nodes)
     :return: the list of actions
     """
-    actions = df[df['Parent_Name'] == node_name]
+    index = tree_index.get_tree_index(df)
+
+    if node_name not in index.name_to_id:
+        return []
+
+    actions = df[ref_col].values[index.get_children(index.get_id(node_name))]
 
     if exclude_actions:
-        actions = actions[~actions[ref_col].isin(exclude_actions)]
+        exclude_actions = set(exclude_actions)
+        actions = [action for action in actions if action not in exclude_actions]
 
-    return list(actions[ref_col].values)
+    return list(actions)
 
 
 def get_root_available_actions(df, exclude_actions=None, ref_col='Name'):
@@ -89,7 +105,8 @@ def get_root_best_action(df):
 
 def get_features(df, node_name, exclude_features=None, feature_col='Game_Features'):
     """
-    Return the feature dictionary of a particular node
+    Return the feature dictionary of a particular node with the original json values, for display. The computations
+    use feature_matrix.get_feature_matrix instead of decoding the json text per call.
     :param df: MCTS data file
     :param node_name: the name of node
     :param exclude_features: the list of features that will be ignored
@@ -115,7 +132,7 @@ def node_name_to_action_name(df, node_name):
     :param node_name: the name of node
     :return: the action name
     """
-    return df[df['Name'] == node_name].iloc[0]['Action_Name']
+    return df['Action_Name'].iat[tree_index.get_tree_index(df).get_id(node_name)]
 
 
 def search_children_by_node_name(df, visit_threshold, node_name):
@@ -126,8 +143,10 @@ def search_children_by_node_name(df, visit_threshold, node_name):
     :param node_name: the name of node
     :return: children list
     """
-    df = df[df['Visits'] >= visit_threshold]
-    return df[df['Parent_Name'] == node_name]['Name'].tolist()
+    index = tree_index.get_tree_index(df)
+    children = index.get_children(index.get_id(node_name))
+    children = children[df['Visits'].values[children] >= visit_threshold]
+    return index.names[children].tolist()
 
 
 def search_similar_node_by_features(df, visit_threshold, node_name, similarity_method, threshold, exclude_features):
@@ -147,26 +166,63 @@ def search_similar_node_by_features(df, visit_threshold, node_name, similarity_m
     if 'Game_Features' not in df.columns:
         return []
 
-    df = df[df['Visits'] >= visit_threshold]
-    feature1 = get_features(df, node_name, exclude_features).values()
+    features = feature_matrix.get_feature_matrix(df)
+    names = df['Name'].to_numpy()
+    node_id = features.node_index[node_name]
+
+    if feature_index.is_indexed_method(similarity_method):
+        # Only the nodes within the threshold are read from the spatial index
+        similar_ids, distances = feature_index.get_feature_index(df, exclude_features).query_radius(
+            node_id, threshold, similarity_method)
+    else:
+        # Compare the node with all nodes in one call
+        values = features.values[:, features.feature_mask(exclude_features)]
+        distances = similarity.batch_distance_similarity_function_dict[similarity_method](values[node_id], values)
+        similar_ids = np.flatnonzero(distances <= threshold)
+        distances = distances[similar_ids]
+
+    is_similar = (df['Visits'].to_numpy()[similar_ids] >= visit_threshold) & (names[similar_ids] != node_name)
+    similar_ids, distances = similar_ids[is_similar], distances[is_similar]
+    similar_ids = similar_ids[np.argsort(distances, kind='stable')]
 
-    similarities = {}
+    return names[similar_ids].tolist()
 
-    for _, row in df.iterrows():
-        if row['Name'] == node_name:
-            continue
-        feature2 = get_features(df, row['Name'], exclude_features).values()
-        value = similarity.distance_similarity_function_dict[similarity_method](feature1, feature2)
-        if value <= threshold:
-            similarities[row['Name']] = value
 
-    similarities = sorted(similarities.items(), key=lambda x: x[1])
-    similarities = [children[0] for children in similarities]
+def search_top_k_similar_node_by_features(df, visit_threshold, node_name, similarity_method, k, exclude_features):
+    """
+    Get the k most similar nodes of node name based on game features difference. The nodes are ranked the same as
+    search_similar_node_by_features.
+    :param df: MCTS data file
+    :param visit_threshold: visit threshold
+    :param node_name: the name of node
+    :param similarity_method: similarity method name
+    :param k: the number of nodes
+    :param exclude_features: exclude feature list
+    :return: similar node list
+    """
+    if 'Game_Features' not in df.columns:
+        return []
+
+    features = feature_matrix.get_feature_matrix(df)
+    names = df['Name'].to_numpy()
+    node_id = features.node_index[node_name]
+    node_mask = (df['Visits'] >= visit_threshold).to_numpy() & (names != node_name)
+
+    if feature_index.is_indexed_method(similarity_method):
+        similar_ids, _ = feature_index.get_feature_index(df, exclude_features).query_top_k(
+            node_id, k, similarity_method, node_mask)
+        return names[similar_ids].tolist()
 
-    return list(similarities)
+    values = features.values[:, features.feature_mask(exclude_features)]
+    distances = similarity.batch_distance_similarity_function_dict[similarity_method](values[node_id], values)
+    similar_ids = np.flatnonzero(node_mask & ~np.isnan(distances))
+    similar_ids = similar_ids[np.argsort(distances[similar_ids], kind='stable')[:k]]
 
+    return names[similar_ids].tolist()
 
-def search_similar_node_by_children_action(df, visit_threshold, node_name, similarity_method, threshold):
+
+def search_similar_node_by_children_action(df, visit_threshold, node_name, similarity_method, threshold,
+                                           mode='exact'):
     """
     Get the list of similar nodes of node name.
     The similarity between two nodes are calculated based on children action difference.
@@ -176,36 +232,28 @@ def search_similar_node_by_children_action(df, visit_threshold, node_name, simil
     :param node_name: the name of node
     :param similarity_method: similarity method name
     :param threshold: similarity threshold
+    :param mode: 'exact' uses the children action bitset, 'approximate' uses MinHash for large action spaces
     :return: similar node list
     """
 
     if 'Action_Name' not in df.columns:
         return []
 
-    df = df[df['Visits'] >= visit_threshold]
-    children_dict = {name: [] for name in df['Name']}
-    action_dict = {name: idx for idx, name in enumerate(df['Action_Name'].unique())}
-
-    for _, row in df.iterrows():
-        if row['Parent_Name'] not in children_dict:
-            children_dict[row['Parent_Name']] = []
-        children_dict[row['Parent_Name']].append(action_dict[row['Action_Name']])
+    action_sets = child_action_sets.get_child_action_sets(df, visit_threshold)
 
-    similarities = {}
-
-    for node, children_list in children_dict.items():
-        if node == node_name:
-            continue
+    if node_name not in action_sets.key_index:
+        return []
 
-        value = similarity.set_similarity_function_dict[similarity_method](children_dict[node_name],
-                                                                           children_dict[node])
-        if value >= threshold:
-            similarities[node] = value
+    # Compare the children actions of the node with all nodes in one pass
+    key_id = action_sets.key_index[node_name]
+    values = action_sets.get_similarities(key_id, similarity_method, mode)
 
-    similarities = sorted(similarities.items(), key=lambda x: x[1])
-    similarities = [children[0] for children in similarities]
+    is_similar = values >= threshold
+    is_similar[key_id] = False
+    similar_ids = np.flatnonzero(is_similar)
+    similar_ids = similar_ids[np.argsort(values[similar_ids], kind='stable')]
 
-    return list(similarities)
+    return action_sets.keys[similar_ids].tolist()
 
 
 
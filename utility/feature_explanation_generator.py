@@ -1,96 +1,245 @@
-from utility import data_preprocessing, feature_explaination_helper_function
-import math
+from utility import data_preprocessing, feature_matrix, tree_index, tree_session
+import numpy as np
 import pandas as pd
 from dash import html
 
 DIFFERENCE_TYPE = ['Higher', 'Same', 'Lower']
 
 
-def get_children_in_depth(df, exclude_action_names=None):
+def get_depth_labels(df, exclude_action_names=None):
     """
-    Generate the dictionary about the related nodes in different depths for each root available actions
+    Label the related nodes of each root available action with the root action and the depth. The root actions are
+    in the row order of the MCTS data file.
     :param df: MCTS data file
     :param exclude_action_names: the list of root action names that will be ignored
-    :return: dictionary about the related nodes in different depths for each root available actions,
-             minimum depth of available actions, maximum depth of available actions
+    :return: the list of root actions, node ids ordered by root action and depth, root action index of the nodes,
+             depth of the nodes
     """
+    index = tree_index.get_tree_index(df)
+    root_actions = data_preprocessing.get_root_available_actions(df, exclude_action_names)
+    node_ids, action_labels, depth_labels = [np.array([], dtype=np.int64)], [np.array([], dtype=np.int64)], \
+        [np.array([], dtype=np.int64)]
+
+    # Walk down the tree level by level from every root action
+    for action_idx, action in enumerate(root_actions):
+        level = np.array([index.get_id(action)])
+        depth = 0
+        while level.size:
+            node_ids.append(level)
+            action_labels.append(np.full(level.size, action_idx))
+            depth_labels.append(np.full(level.size, depth))
+            level = index.get_children_ids(level)
+            depth += 1
+
+    return root_actions, np.concatenate(node_ids), np.concatenate(action_labels), np.concatenate(depth_labels)
+
+
+def get_feature_difference_types(root_values, node_values, rel_tol=0.001):
+    """
+    Compare the features of nodes with the root features. Two values are the same if they are close as
+    math.isclose, otherwise the node value is higher or lower (missing values are lower).
+    :param root_values: numpy array of root features
+    :param node_values: 2-D numpy array (nodes x features)
+    :param rel_tol: the relative tolerance of the same value
+    :return: 3-D boolean numpy array (nodes x DIFFERENCE_TYPE x features)
+    """
+    with np.errstate(invalid='ignore', over='ignore'):
+        same = (node_values == root_values) | (np.isfinite(node_values) & np.isfinite(root_values) &
+                                               (np.abs(node_values - root_values) <=
+                                                rel_tol * np.maximum(np.abs(node_values), np.abs(root_values))))
+        higher = ~same & (node_values > root_values)
+
+    return np.stack([higher, same, ~(same | higher)], axis=1)
+
 
-    def helper(current_depth, root_action):
+class FeatureExplanationCube:
+    """
+    Numeric summary of game feature changes. counts[a, t, f, d] is the number of nodes of root action a at depth d
+    whose feature f is DIFFERENCE_TYPE[t] than root, and totals[a, d] is the number of nodes of root action a at
+    depth d (0 if the action does not reach the depth). Percentages are rounded to one decimal place as shown in the
+    table. The depths are labelled "Immediate", "1", "2" ...
+    """
+    def __init__(self, actions, features, depths, counts, totals):
+        self.actions = list(actions)
+        self.features = list(features)
+        self.depths = list(depths)
+        self.counts = np.asarray(counts, dtype=np.int64).reshape(len(self.actions), len(DIFFERENCE_TYPE),
+                                                                 len(self.features), len(self.depths))
+        self.totals = np.asarray(totals, dtype=np.int64).reshape(len(self.actions), len(self.depths))
+        self._percentages = None
+
+    @property
+    def percentages(self):
         """
-        Recursive function that helps to generate the list of children node for particular
-        root action in different depth
-        :param current_depth: current depth of root action
-        :param root_action: the name of root action
+        The percentages of counts in totals, computed on first use (NaN if the action does not reach the depth)
         """
-        if current_depth not in root_actions_depth_dict[root_action]:
-            return
+        if self._percentages is None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratios = self.counts / self.totals[:, None, None, :] * 100
+            ratios[np.broadcast_to(self.totals[:, None, None, :] == 0, ratios.shape)] = np.nan
+            self._percentages = np.array([float(f"{ratio:.1f}") for ratio in ratios.ravel()]).reshape(ratios.shape)
 
-        # Generate the list of all available node's name from current depth
-        children_actions_from_current_depth_list = []
-        for children_action in root_actions_depth_dict[root_action][current_depth]:
-            children_actions_from_current_depth_list += data_preprocessing.get_node_available_actions(df,
-                                                                                                      children_action)
+        return self._percentages
 
-        # Add to dictionary if the list is not empty
-        if len(children_actions_from_current_depth_list) != 0:
-            root_actions_depth_dict[root_action][current_depth + 1] = children_actions_from_current_depth_list
+    @property
+    def nbytes(self):
+        return self.counts.nbytes + self.totals.nbytes
 
-        # Go to next depth level
-        return helper(current_depth + 1, root_action)
+    def get_action_max_depths(self):
+        """
+        Return the maximum depth reached by every action
+        :return: numpy array of maximum depths
+        """
+        return (self.totals > 0).sum(axis=1) - 1
 
-    root_actions = data_preprocessing.get_root_available_actions(df, exclude_action_names)
-    root_actions_depth_dict = {action: {0: [action]} for action in root_actions}
+    def to_dict(self):
+        """
+        Encode the cube for the dcc.Store. The labels are kept as plain lists and the counts are flattened in C order,
+        their shape is given by the number of labels.
+        :return: JSON serialisable dictionary
+        """
+        return {"actions": self.actions, "features": self.features, "depths": self.depths,
+                "counts": self.counts.ravel().tolist(), "totals": self.totals.ravel().tolist()}
 
-    max_depth = float('-inf')
-    min_depth = float('inf')
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Decode the cube encoded by to_dict
+        :param data: dictionary from the dcc.Store
+        :return: FeatureExplanationCube
+        """
+        return cls(data['actions'], data['features'], data['depths'], data['counts'], data['totals'])
+
+    def select(self, actions=None, features=None, depth_number=None, action_labels=None):
+        """
+        Return the cube of the selected actions, features and depths
+        :param actions: the list of action names, all actions if None
+        :param features: the list of feature names, all features if None
+        :param depth_number: the number of depths from Immediate, all depths if None
+        :param action_labels: the new names of the selected actions, the same names if None
+        :return: FeatureExplanationCube
+        """
+        action_idx = [self.actions.index(action) for action in actions] if actions is not None \
+            else list(range(len(self.actions)))
+        feature_idx = [self.features.index(feature) for feature in features] if features is not None \
+            else list(range(len(self.features)))
+        depth_idx = list(range(min(depth_number, len(self.depths)) if depth_number is not None else len(self.depths)))
+
+        if action_labels is None:
+            action_labels = [self.actions[idx] for idx in action_idx]
+
+        return FeatureExplanationCube(action_labels, [self.features[idx] for idx in feature_idx],
+                                      [self.depths[idx] for idx in depth_idx],
+                                      self.counts[np.ix_(action_idx, range(len(DIFFERENCE_TYPE)), feature_idx,
+                                                         depth_idx)],
+                                      self.totals[np.ix_(action_idx, depth_idx)])
+
+    def get_same_rates(self):
+        """
+        Return the average rate of nodes that the feature is the same as root over all actions and depths
+        :return: dictionary of feature name and same rate
+        """
+        same_rates = {}
+        same_idx = DIFFERENCE_TYPE.index('Same')
+
+        for feature_idx, feature in enumerate(self.features):
+            # Average in the order of the table (depth then action)
+            same_vals = [val for val in self.percentages[:, same_idx, feature_idx, :].T.ravel() if not np.isnan(val)]
+            same_rates[feature] = sum(same_vals) / len(same_vals) / 100
+
+        return same_rates
 
-    # Generate the depth dictionary for different root actions and
-    # record the minimum and maximum depth for the MCTS tree
-    for action in root_actions:
-        helper(0, action)
-        action_max_depth = max(root_actions_depth_dict[action])
-        max_depth = max(max_depth, action_max_depth)
-        min_depth = min(min_depth, action_max_depth)
+    def drop_features_by_change_ratio(self, change_ratio=0.1):
+        """
+        Drop the feature if it does not change much
+        :param change_ratio: the change threshold that will use to estimate the features that does not change much
+        :return: FeatureExplanationCube
+        """
+        change_threshold = 1 - change_ratio
+        same_rates = self.get_same_rates()
+        return self.select(features=[feature for feature in self.features if same_rates[feature] <= change_threshold])
+
+    def to_percentage_df(self):
+        """
+        Return the percentages as dataframe indexed by (Feature, Depth) with (Action, Direction) columns
+        :return: the feature percentage dataframe
+        """
+        index = pd.MultiIndex.from_product([self.features, self.depths], names=['Feature', 'Depth'])
+        columns = pd.MultiIndex.from_product([self.actions, DIFFERENCE_TYPE])
+        values = self.percentages.transpose(2, 3, 0, 1).reshape(len(index), len(columns))
+        return pd.DataFrame(values, index=index, columns=columns)
+
+    def to_table_df(self):
+        """
+        Return the table of "percentage%(count)" text. The cell is None if the action does not reach the depth.
+        :return: the feature summary dataframe
+        """
+        percentage_df = self.to_percentage_df()
+        counts = self.counts.transpose(2, 3, 0, 1).reshape(percentage_df.shape)
+        values = [[None if np.isnan(percentage) else f"{percentage:.1f}%({count})"
+                   for percentage, count in zip(percentage_row, count_row)]
+                  for percentage_row, count_row in zip(percentage_df.values, counts)]
 
-    return root_actions_depth_dict, min_depth, max_depth
+        return pd.DataFrame(values, index=percentage_df.index, columns=percentage_df.columns, dtype=object)
 
 
-def get_feature_counts(df, root_features, node_list, exclude_features=None, feature_col='Game_Features', rel_tol=0.001):
+def build_full_feature_explanation_cube(df, feature_col='Game_Features', rel_tol=0.001):
     """
-    Return the game feature summary about feature changes between root features and other features in node_list
+    Count the game feature changes of every root action node, every root feature and every depth of the tree
     :param df: MCTS data file
-    :param root_features: the root node features
-    :param node_list: the list of node names
-    :param exclude_features: the list of features will be ignored
     :param feature_col: the column name of features
-    :param rel_tol: the column name used for getting available actions (It needs to be unique for different nodes)
-    :return: game feature summary dictionary
+    :param rel_tol: the relative tolerance of the same value
+    :return: FeatureExplanationCube labelled by root action node names
     """
-    # Init the game feature summary dictionary
-    game_feature_summary = {feature: {difference_type: 0 for difference_type in DIFFERENCE_TYPE} for feature in
-                            root_features}
-
-    # count the features changes for every feature in every node
-    for node_name in node_list:
-        node_features = data_preprocessing.get_features(df, node_name, exclude_features, feature_col)
-        for feature in root_features:
-            root_val = root_features[feature]
-            node_val = node_features[feature]
-
-            if math.isclose(root_val, node_val, rel_tol=rel_tol):
-                game_feature_summary[feature]['Same'] += 1
-            elif node_val > root_val:
-                game_feature_summary[feature]['Higher'] += 1
-            else:
-                game_feature_summary[feature]['Lower'] += 1
+    # Label the related nodes in different depths for each root available actions
+    root_actions, node_ids, action_labels, depth_labels = get_depth_labels(df)
+
+    # Get the root node features
+    root_name = data_preprocessing.get_root_node_name(df)
+    features = feature_matrix.get_feature_matrix(df, feature_col)
+    root_features = features.get_features(root_name)
+
+    # Compare all the related nodes with root at once
+    feature_columns = [features.feature_index[feature] for feature in root_features]
+    difference_types = get_feature_difference_types(np.array(list(root_features.values())),
+                                                     features.values[np.ix_(node_ids, feature_columns)], rel_tol)
+
+    # Sum the difference types of every root action and depth (the nodes are ordered by root action and depth)
+    depth_number = int(depth_labels.max()) + 1 if depth_labels.size else 0
+    group_labels = action_labels * depth_number + depth_labels
+    group_number = len(root_actions) * depth_number
+    group_starts = np.flatnonzero(np.r_[True, group_labels[1:] != group_labels[:-1]]) if node_ids.size else node_ids
+
+    counts = np.zeros((group_number, len(DIFFERENCE_TYPE), len(feature_columns)), dtype=np.int64)
+    if node_ids.size:
+        counts[group_labels[group_starts]] = np.add.reduceat(difference_types.astype(np.int64), group_starts, axis=0)
+    totals = np.bincount(group_labels, minlength=group_number)
 
-    return game_feature_summary
+    counts = counts.reshape(len(root_actions), depth_number, len(DIFFERENCE_TYPE), len(feature_columns))
+    depths = ['Immediate' if depth == 0 else str(depth) for depth in range(depth_number)]
+    return FeatureExplanationCube(root_actions, root_features, depths, counts.transpose(0, 2, 3, 1),
+                                  totals.reshape(len(root_actions), depth_number))
 
 
-def generate_feature_explanation_df(df, depth_type='max', exclude_action_nodes=None, exclude_features=None,
-                                    feature_col='Game_Features', change_ratio=0, rel_tol=0.001):
+def get_full_feature_explanation_cube(df, feature_col='Game_Features', rel_tol=0.001):
     """
-    Return the dataframe of explanations based on game features changes in different depth
+    Return the feature explanation cube of all root actions, features and depths. It is built once per feature column
+    and relative tolerance for the uploaded tree.
+    :param df: MCTS data file
+    :param feature_col: the column name of features
+    :param rel_tol: the relative tolerance of the same value
+    :return: FeatureExplanationCube labelled by root action node names
+    """
+    return tree_session.get_artifact(df, ('feature_explanation_cube', feature_col, rel_tol),
+                                     lambda data: build_full_feature_explanation_cube(data, feature_col, rel_tol))
+
+
+def generate_feature_explanation_cube(df, depth_type='max', exclude_action_nodes=None, exclude_features=None,
+                                      feature_col='Game_Features', change_ratio=0, rel_tol=0.001):
+    """
+    Return the numeric summary of game features changes in different depth. It is sliced from the cached full cube.
+    The actions keep the row order of the root children with the best action moved to the front, so the table and
+    the text explanation list them in the same order every time.
     :param df: MCTS data file
     :param depth_type: can be ['max', 'min', 'average']. It will decide the depth of each feature. Max means using the
                         maximum depth of root actions. Min means using the minimum depth of root actions. Average means
@@ -100,10 +249,15 @@ def generate_feature_explanation_df(df, depth_type='max', exclude_action_nodes=N
     :param feature_col: the column name of features
     :param change_ratio: the change threshold that will use to estimate the features that does not change much
     :param rel_tol: the column name used for getting available actions (It needs to be unique for different nodes)
-    :return: the game features explanation dataframe
+    :return: FeatureExplanationCube, maximum depth
     """
-    # Generate the dictionary about the related nodes in different depths for each root available actions
-    root_actions_depth_dict, min_depth, max_depth = get_children_in_depth(df, exclude_action_nodes)
+    full_cube = get_full_feature_explanation_cube(df, feature_col, rel_tol)
+    root_actions = data_preprocessing.get_root_available_actions(df, exclude_action_nodes)
+
+    # Record the minimum and maximum depth of available actions for the MCTS tree
+    action_max_depths = full_cube.select(actions=root_actions).get_action_max_depths().tolist()
+    max_depth = max(action_max_depths, default=float('-inf'))
+    min_depth = min(action_max_depths, default=float('inf'))
 
     # Decide the maximum depth for the dataframe
     if depth_type == 'max':
@@ -116,98 +270,46 @@ def generate_feature_explanation_df(df, depth_type='max', exclude_action_nodes=N
     # Reformat the change ratio from number to percentage
     change_ratio = change_ratio / 100
 
-    # Get the root node features
-    root_name = data_preprocessing.get_root_node_name(df)
-    root_features = data_preprocessing.get_features(df, root_name, exclude_features, feature_col)
-
-    features_differences = {}
-
-    # Loop for each available root action and do to feature change statistics
-    for root_action, action_depth_dict in root_actions_depth_dict.items():
-        root_action_name = data_preprocessing.node_name_to_action_name(df, root_action)
-        # Create dictionaries for each different type
-        for difference_type in DIFFERENCE_TYPE:
-            features_differences[(root_action_name, difference_type)] = dict()
-
-        # Loop through the different depth and summary the feature difference
-        for depth, node_list in action_depth_dict.items():
-            if depth > maximum_depth:
-                break
+    # Root actions with the same action name are merged into the last one
+    action_names = {}
+    for root_action in root_actions:
+        action_names[data_preprocessing.node_name_to_action_name(df, root_action)] = root_action
 
-            if depth == 0:
-                depth = "Immediate"
-
-            game_feature_summary = get_feature_counts(df, root_features, node_list, exclude_features, feature_col,
-                                                      rel_tol)
-
-            for feature, summary in game_feature_summary.items():
-                for difference_type, count in summary.items():
-                    features_differences[(root_action_name, difference_type)][
-                        (feature, depth)] = f"{count / len(node_list) * 100:.1f}%({count})"
+    root_name = data_preprocessing.get_root_node_name(df)
+    root_features = feature_matrix.get_feature_matrix(df, feature_col).get_features(root_name, exclude_features)
+    depth_number = maximum_depth + 1 if action_names else 0
 
-    # Change dictionary to Dataframe and reorder the index
-    feature_order_dict = {name: idx for idx, name in enumerate(list(root_features))}
-    feature_df = pd.DataFrame.from_dict(features_differences)
-    feature_df.sort_index(inplace=True, key=lambda x: [i if type(i) == int else 0 for i in x], level=1)
-    feature_df.sort_index(inplace=True, key=lambda x: [feature_order_dict[i] for i in x], level=0, sort_remaining=False)
-    feature_df.index.names = ['Feature', 'Depth']
+    cube = full_cube.select(list(action_names.values()), list(root_features), depth_number, list(action_names))
 
     best_action = data_preprocessing.get_root_best_action(df)
-    feature_df = reorder_explanation_df_by_best_action(feature_df, best_action)
-    feature_df = drop_feature_by_change_ratio(feature_df, change_ratio)
+    cube = cube.select(actions=reorder_actions_by_best_action(cube.actions, best_action))
+    cube = cube.drop_features_by_change_ratio(change_ratio)
 
-    return feature_df, maximum_depth
+    return cube, maximum_depth
 
 
-def reorder_explanation_df_by_best_action(feature_df, best_action):
+def reorder_actions_by_best_action(actions, best_action):
     """
-    Reorder the columns to put the best action in the front
+    Reorder the actions to put the best action in the front, the other actions keep their order
+    :param actions: the list of action names
     :param best_action: the action name of best action from root
-    :param feature_df: the feature summary dataframe
-    :return: the reorder explanation df
-    """
-    actions = list(set(feature_df.columns.get_level_values(0)))
-
-    if best_action not in actions:
-        return feature_df
-
-    best_action_idx = actions.index(best_action) + 1
-
-    if best_action_idx > 0:
-        actions = [best_action] + actions
-        actions.pop(best_action_idx)
-
-    new_cols, _ = feature_df.columns.reindex(actions, level=0)
-    return feature_df[new_cols]
-
-
-def drop_feature_by_change_ratio(feature_df, change_ratio=0.1):
-    """
-    Drop the feature from dataframe if it does not change much
-    :param feature_df: the feature summary dataframe
-    :param change_ratio: the change threshold that will use to estimate the features that does not change much
-    :return: feature summary dataframe
+    :return: the reordered action names
     """
-    change_threshold = 1 - change_ratio
-    drop_feature_list = []
-    for feature in feature_df.index.get_level_values(0).unique():
-        feature_same_str_vals = feature_df.loc[(feature, slice(None)), (slice(None), "Same")].values.reshape(-1)
-        feature_same_vals = feature_explaination_helper_function.str_percentage_to_float(feature_same_str_vals)
+    actions = list(dict.fromkeys(actions))
 
-        same_rate = sum(feature_same_vals) / len(feature_same_vals) / 100
-        if same_rate > change_threshold:
-            drop_feature_list.append(feature)
+    if best_action in actions:
+        actions.remove(best_action)
+        actions.insert(0, best_action)
 
-    return feature_df.drop(index=drop_feature_list, level=0)
+    return actions
 
 
 def get_feature_average_val(feature_df, feature_name, action_name, direction, depth=None):
     if depth:
-        feature_str_val = feature_df.loc[(feature_name, depth), (action_name, direction)]
-        return feature_explaination_helper_function.str_percentage_to_float([feature_str_val])[0]
+        return float(feature_df.loc[(feature_name, depth), (action_name, direction)])
     else:
-        feature_str_vals = feature_df.loc[(feature_name, slice(None)), (action_name, direction)].values.reshape(-1)
-    feature_vals = feature_explaination_helper_function.str_percentage_to_float(feature_str_vals)
+        feature_vals = feature_df.loc[(feature_name, slice(None)), (action_name, direction)].values.reshape(-1)
+    feature_vals = [val for val in feature_vals if not np.isnan(val)]
     feature_average_val = sum(feature_vals) / len(feature_vals)
     return feature_average_val
 
@@ -0,0 +1,155 @@
+from functools import lru_cache
+import numpy as np
+from utility import tree_session, feature_matrix, similarity
+
+# The Minkowski p-norm of the distance methods served by the spatial index
+MINKOWSKI_P = {
+    'Euclidean': 2,
+    'Manhattan': 1
+}
+
+
+@lru_cache(maxsize=None)
+def has_scipy():
+    """
+    Check if scipy is installed
+    :return: True or False
+    """
+    try:
+        import scipy
+    except ImportError:
+        return False
+    return True
+
+
+def is_indexed_method(similarity_method):
+    """
+    Check if the similarity method can be answered by the spatial index
+    :param similarity_method: similarity method name
+    :return: True or False
+    """
+    return similarity_method in MINKOWSKI_P and has_scipy()
+
+
+class FeatureIndex:
+    """
+    KD-tree over the feature vectors of the nodes without the excluded features. Nodes with missing features are
+    not indexed because their distance to any node is NaN. The candidates of a query are re-checked with the
+    batched distance functions, so the results are the same as the brute-force search.
+    """
+    def __init__(self, values, exclude_features=None):
+        from scipy.spatial import cKDTree
+
+        self.exclude_features = frozenset(exclude_features or [])
+        self.values = values
+        self.node_ids = np.flatnonzero(np.isfinite(values).all(axis=1))
+        self.tree = cKDTree(values[self.node_ids])
+
+    @classmethod
+    def from_feature_matrix(cls, features, exclude_features=None):
+        """
+        Build the index of a feature matrix
+        :param features: FeatureMatrix
+        :param exclude_features: the list of features that will be ignored
+        :return: FeatureIndex
+        """
+        return cls(features.values[:, features.feature_mask(exclude_features)], exclude_features)
+
+    @property
+    def nbytes(self):
+        # The KD-tree keeps a copy of the indexed data and a permutation of it
+        indexed_nbytes = self.node_ids.size * (self.values.shape[1] * self.values.itemsize + 8)
+        return self.values.nbytes + self.node_ids.nbytes + indexed_nbytes
+
+    def get_distances(self, node_id, node_ids, similarity_method):
+        """
+        Return the exact distances between a node and the nodes
+        :param node_id: the id of node
+        :param node_ids: numpy array of node ids
+        :param similarity_method: similarity method name
+        :return: numpy array of distances
+        """
+        return similarity.batch_distance_similarity_function_dict[similarity_method](self.values[node_id],
+                                                                                     self.values[node_ids])
+
+    def query_radius(self, node_id, threshold, similarity_method):
+        """
+        Return the nodes whose distance to the node is not more than the threshold
+        :param node_id: the id of node
+        :param threshold: the distance threshold
+        :param similarity_method: 'Euclidean' or 'Manhattan'
+        :return: numpy array of node ids in row order and numpy array of their distances
+        """
+        x = self.values[node_id]
+
+        if not np.isfinite(x).all() or threshold < 0:
+            return np.array([], dtype=np.int64), np.array([])
+
+        # Widen the radius a little so that no node is lost by the rounding of KD-tree distances
+        radius = threshold * (1 + 1e-9) + 1e-12
+        candidates = self.tree.query_ball_point(x, radius, p=MINKOWSKI_P[similarity_method])
+        node_ids = np.sort(self.node_ids[np.asarray(candidates, dtype=np.int64)])
+
+        distances = self.get_distances(node_id, node_ids, similarity_method)
+        is_matched = distances <= threshold
+        return node_ids[is_matched], distances[is_matched]
+
+    def query_top_k(self, node_id, k, similarity_method, node_mask=None):
+        """
+        Return the k nearest nodes of the node, ranked by distance and then row order
+        :param node_id: the id of node
+        :param k: the number of nodes
+        :param similarity_method: 'Euclidean' or 'Manhattan'
+        :param node_mask: boolean numpy array of the nodes that can be returned
+        :return: numpy array of node ids and numpy array of their distances
+        """
+        x = self.values[node_id]
+
+        if not np.isfinite(x).all() or k <= 0 or not self.node_ids.size:
+            return np.array([], dtype=np.int64), np.array([])
+
+        query_k = k
+        while True:
+            query_k = min(query_k, self.node_ids.size)
+            distances, candidates = self.tree.query(x, k=query_k, p=MINKOWSKI_P[similarity_method])
+            candidates = np.atleast_1d(candidates)
+            node_ids = self.node_ids[candidates[candidates < self.node_ids.size]]
+
+            if node_mask is not None:
+                node_ids = node_ids[node_mask[node_ids]]
+
+            if node_ids.size >= k or query_k == self.node_ids.size:
+                # Include all the nodes as far as the k-th node so that the ties are ranked by row order
+                radius = np.max(np.atleast_1d(distances)) if node_ids.size else 0
+                node_ids, distances = self.query_radius(node_id, radius * (1 + 1e-9) + 1e-12, similarity_method)
+                if node_mask is not None:
+                    distances = distances[node_mask[node_ids]]
+                    node_ids = node_ids[node_mask[node_ids]]
+
+                order = np.argsort(distances, kind='stable')[:k]
+                return node_ids[order], distances[order]
+
+            query_k *= 2
+
+
+def get_feature_index(df, exclude_features=None, feature_col='Game_Features'):
+    """
+    Return the spatial index of the feature column. It is built on first use and rebuilt when the excluded features
+    change.
+    :param df: MCTS data file
+    :param exclude_features: the list of features that will be ignored
+    :param feature_col: the name of feature column
+    :return: FeatureIndex
+    """
+    key = ('feature_index', feature_col)
+
+    def build(data):
+        return FeatureIndex.from_feature_matrix(feature_matrix.get_feature_matrix(data, feature_col), exclude_features)
+
+    index = tree_session.get_artifact(df, key, build)
+
+    if index.exclude_features != frozenset(exclude_features or []):
+        index = build(df)
+        tree_session.set_artifact(df, key, index)
+
+    return index
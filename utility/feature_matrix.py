@@ -0,0 +1,92 @@
+import json
+import numpy as np
+import pandas as pd
+from utility import tree_session
+
+
+class FeatureMatrix:
+    """
+    Dense numeric matrix of a json-formatted feature column. Row i is the features of the i-th node of the
+    MCTS data file and column j is the j-th feature name.
+    """
+    def __init__(self, values, feature_names, node_names):
+        self.values = values
+        self.feature_names = list(feature_names)
+        self.feature_index = {name: idx for idx, name in enumerate(self.feature_names)}
+        self.node_index = {name: idx for idx, name in enumerate(node_names)}
+
+    @classmethod
+    def from_df(cls, df, feature_col='Game_Features'):
+        """
+        Decode the json-formatted feature column once and build the feature matrix
+        :param df: MCTS data file
+        :param feature_col: the name of feature column
+        :return: FeatureMatrix
+        """
+        records = [json.loads(text) if isinstance(text, str) else {} for text in df[feature_col]]
+        return cls.from_feature_df(pd.DataFrame.from_records(records), df['Name'].tolist())
+
+    @classmethod
+    def from_feature_df(cls, feature_df, node_names):
+        """
+        Build the feature matrix of decoded features, e.g. the fields of a Parquet struct column
+        :param feature_df: dataframe with one column per feature and one row per node
+        :param node_names: the list of node names
+        :return: FeatureMatrix
+        """
+        feature_df = feature_df.apply(pd.to_numeric, errors='coerce')
+        values = feature_df.to_numpy(dtype=np.float64)
+
+        return cls(values, feature_df.columns.tolist(), node_names)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def feature_mask(self, exclude_features=None):
+        """
+        Return the boolean mask of the feature columns that are not excluded
+        :param exclude_features: the list of features that will be ignored
+        :return: boolean numpy array
+        """
+        mask = np.ones(len(self.feature_names), dtype=bool)
+
+        if exclude_features:
+            for exclude_feature in exclude_features:
+                if exclude_feature in self.feature_index:
+                    mask[self.feature_index[exclude_feature]] = False
+
+        return mask
+
+    def get_features(self, node_name, exclude_features=None):
+        """
+        Return the numeric feature dictionary of a particular node for the vectorised computations. Missing and
+        non-numeric features are not included, data_preprocessing.get_features returns the original values.
+        :param node_name: the name of node
+        :param exclude_features: the list of features that will be ignored
+        :return: features dictionary
+        """
+        row = self.values[self.node_index[node_name]]
+        mask = self.feature_mask(exclude_features) & ~np.isnan(row)
+        return {name: float(value) for name, value, is_included in zip(self.feature_names, row, mask) if is_included}
+
+
+def get_feature_matrix(df, feature_col='Game_Features'):
+    """
+    Return the feature matrix of the feature column. It is built once per feature column for the uploaded tree.
+    :param df: MCTS data file
+    :param feature_col: the name of feature column
+    :return: FeatureMatrix
+    """
+    return tree_session.get_artifact(df, ('feature_matrix', feature_col),
+                                     lambda data: FeatureMatrix.from_df(data, feature_col))
+
+
+def set_feature_matrix(df, features, feature_col='Game_Features'):
+    """
+    Cache a feature matrix that is already built, e.g. while reading a columnar file
+    :param df: MCTS data file
+    :param features: FeatureMatrix
+    :param feature_col: the name of feature column
+    """
+    tree_session.set_artifact(df, ('feature_matrix', feature_col), features)
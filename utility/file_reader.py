@@ -0,0 +1,208 @@
+import hashlib
+import io
+import json
+import os
+import pandas as pd
+from utility import feature_matrix
+
+PARQUET_EXTENSIONS = ['.parquet', '.pq']
+FEATHER_EXTENSIONS = ['.feather', '.arrow', '.ipc']
+ARROW_STREAM_EXTENSIONS = ['.arrows']
+
+HASH_CHUNK_SIZE = 1024 ** 2
+
+# Feather V1 files start with this magic number, Feather V2 files are Arrow IPC files
+FEATHER_V1_MAGIC = b'FEA1'
+
+
+def get_file_format(filename):
+    """
+    Return the file format by the extension of filename. Unknown extensions are read as tab-separated text.
+    :param filename: the name of MCTS file
+    :return: 'parquet', 'feather', 'arrow_stream' or 'tsv'
+    """
+    extension = os.path.splitext(filename)[1].lower() if filename else ''
+
+    if extension in PARQUET_EXTENSIONS:
+        return 'parquet'
+    if extension in FEATHER_EXTENSIONS:
+        return 'feather'
+    if extension in ARROW_STREAM_EXTENSIONS:
+        return 'arrow_stream'
+    return 'tsv'
+
+
+def get_content_hash(source, filename):
+    """
+    Return the sha256 digest of the MCTS file content and its format. The same tree gets the same digest no matter
+    where it is loaded from. Files on disk are hashed in chunks.
+    :param source: file path or bytes
+    :param filename: the name of MCTS file (used to decide the file format)
+    :return: hex digest
+    """
+    digest = hashlib.sha256(get_file_format(filename).encode())
+
+    if isinstance(source, bytes):
+        digest.update(source)
+    else:
+        with open(source, 'rb') as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _to_source(source):
+    """
+    Wrap raw bytes so that pandas and pyarrow can read them like a file
+    """
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    return source
+
+
+def _read_arrow_table(source, file_format):
+    """
+    Read the columnar file as arrow table. Files on disk are memory-mapped instead of being copied into memory.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+
+    is_path = isinstance(source, str)
+    if not is_path:
+        source = pa.BufferReader(source)
+
+    if file_format == 'parquet':
+        return pq.read_table(source, memory_map=is_path)
+
+    if file_format == 'feather':
+        return feather.read_table(source, memory_map=is_path)
+
+    if is_path:
+        source = pa.memory_map(source)
+    return pa.ipc.open_stream(source).read_all()
+
+
+def _nested_column_to_feature_df(column):
+    """
+    Return the fields of a struct or map column as dataframe (one column per key) without json encoding. Missing
+    keys and null rows are NaN.
+    """
+    import pyarrow as pa
+
+    if pa.types.is_struct(column.type):
+        # flatten() applies the null rows of the struct to its fields
+        fields = pa.Table.from_arrays(column.flatten(), names=[field.name for field in column.type])
+        return fields.to_pandas(integer_object_nulls=True)
+
+    return pd.DataFrame.from_records([dict(value) if value is not None else {} for value in column.to_pylist()])
+
+
+def _nested_column_to_json(column, feature_df):
+    """
+    Return the json text of each row of a struct or map column, like the json column of tab-separated file
+    """
+    import pyarrow as pa
+
+    is_valid = column.is_valid().to_numpy(zero_copy_only=False)
+
+    if pa.types.is_struct(column.type):
+        # The rows are encoded by pandas in C instead of json.dumps per row
+        texts = feature_df.to_json(orient='records', lines=True, double_precision=15).splitlines() \
+            if len(feature_df.columns) else ['{}'] * len(feature_df)
+    else:
+        texts = [json.dumps(dict(value)) if value is not None else None for value in column.to_pylist()]
+
+    return [text if valid else None for text, valid in zip(texts, is_valid)]
+
+
+def _arrow_table_to_df(table, feature_matrices=None):
+    """
+    Transfer the arrow table to MCTS data file. Nested columns (struct or map) are stored as json text like the
+    tab-separated file, and missing Parent_Name is stored as 'None'. The feature matrices of the nested columns are
+    built from their fields directly and put into feature_matrices if it is given.
+    """
+    import pyarrow as pa
+
+    column_names = table.schema.names
+    nested_columns = {}
+    feature_dfs = {}
+    for field in table.schema:
+        if pa.types.is_struct(field.type) or pa.types.is_map(field.type):
+            column = table.column(field.name).combine_chunks()
+            feature_dfs[field.name] = _nested_column_to_feature_df(column)
+            nested_columns[field.name] = _nested_column_to_json(column, feature_dfs[field.name])
+            table = table.drop([field.name])
+
+    df = table.to_pandas()
+
+    for name, values in nested_columns.items():
+        df[name] = values
+    df = df[column_names]
+
+    if 'Parent_Name' in df.columns:
+        df['Parent_Name'] = df['Parent_Name'].fillna('None')
+
+    if feature_matrices is not None and 'Name' in df.columns:
+        node_names = df['Name'].tolist()
+        for name, feature_df in feature_dfs.items():
+            feature_matrices[name] = feature_matrix.FeatureMatrix.from_feature_df(feature_df, node_names)
+
+    return df
+
+
+def _is_feather_v1(source):
+    """
+    Check if the Feather file is the legacy version 1 format, which is not an Arrow IPC file
+    """
+    if isinstance(source, bytes):
+        return source[:len(FEATHER_V1_MAGIC)] == FEATHER_V1_MAGIC
+
+    with open(source, 'rb') as file:
+        return file.read(len(FEATHER_V1_MAGIC)) == FEATHER_V1_MAGIC
+
+
+def get_column_names(source, filename):
+    """
+    Return the column names of the MCTS file without reading its data (only the header for text file)
+    :param source: file path or bytes
+    :param filename: the name of MCTS file
+    :return: the list of column names
+    """
+    file_format = get_file_format(filename)
+
+    if file_format == 'tsv':
+        return pd.read_csv(_to_source(source), sep='\t', nrows=0).columns.tolist()
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file_format == 'feather' and _is_feather_v1(source):
+        # Feather V1 has no schema-only read, the table is memory-mapped (or read from the buffer) without a copy
+        return _read_arrow_table(source, file_format).schema.names
+
+    if isinstance(source, bytes):
+        source = pa.BufferReader(source)
+
+    if file_format == 'parquet':
+        return pq.read_schema(source).names
+    if file_format == 'feather':
+        return pa.ipc.open_file(source).schema.names
+    return pa.ipc.open_stream(source).schema.names
+
+
+def read_mcts_file(source, filename, feature_matrices=None):
+    """
+    Read the MCTS file. Tab-separated text, Parquet, Feather and Arrow IPC (file or stream) are supported.
+    :param source: file path or bytes
+    :param filename: the name of MCTS file (used to decide the file format)
+    :param feature_matrices: dictionary that receives the FeatureMatrix of each nested column of a columnar file
+    :return: MCTS data file
+    """
+    file_format = get_file_format(filename)
+
+    if file_format == 'tsv':
+        return pd.read_csv(_to_source(source), sep='\t')
+
+    return _arrow_table_to_df(_read_arrow_table(source, file_format), feature_matrices)
@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+import uuid
+import numpy as np
+from utility import tree_session
+
+LAYOUT_CACHE_DIR = '.layout_cache'
+LAYOUT_CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+logger = logging.getLogger(__name__)
+
+
+class LayoutCache:
+    """
+    Node positions saved in a local directory, one .npy file per layout. The least recently used files are removed
+    once the directory goes beyond max_bytes.
+    """
+    def __init__(self, directory=LAYOUT_CACHE_DIR, max_bytes=LAYOUT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def get_path(self, key):
+        return os.path.join(self.directory, f'{key}.npy')
+
+    def load(self, key):
+        """
+        Return the cached positions and mark them as recently used
+        :param key: layout key
+        :return: 2-D numpy array of positions, None if the layout is not cached
+        """
+        path = self.get_path(key)
+
+        try:
+            positions = np.load(path, allow_pickle=False)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        return positions
+
+    def save(self, key, positions):
+        """
+        Save the positions and evict the least recently used layouts. A failed write only skips the cache.
+        :param key: layout key
+        :param positions: 2-D numpy array of positions
+        """
+        path = self.get_path(key)
+        temporary_path = f'{path}.{uuid.uuid4().hex}.tmp'
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temporary_path, 'wb') as file:
+                np.save(file, positions, allow_pickle=False)
+            os.replace(temporary_path, path)
+        except OSError as error:
+            logger.warning('Layout cache %s cannot be written: %s', path, error)
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used layouts until the directory is within max_bytes. The most recently used
+        layout is always kept.
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.npy')]
+            stats = sorted((stat.st_mtime, stat.st_size, entry.path) for entry, stat in
+                           zip(entries, map(os.DirEntry.stat, entries)))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in stats[:-1]:
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def get_positions(self, key, builder):
+        """
+        Return the cached positions or compute them with builder() and save them
+        :param key: layout key
+        :param builder: function that returns 2-D numpy array of positions
+        :return: 2-D numpy array of positions
+        """
+        positions = self.load(key)
+
+        if positions is None:
+            positions = builder()
+            self.save(key, positions)
+
+        return positions
+
+
+layout_cache = LayoutCache()
+
+
+def get_structure_hash(df):
+    """
+    Return the sha256 digest of the tree structure (Name and Parent_Name columns). Trees with the same nodes in the
+    same row order get the same digest even if their other columns are different.
+    :param df: MCTS data file
+    :return: hex digest
+    """
+    def build(data):
+        digest = hashlib.sha256()
+        for column in ['Name', 'Parent_Name']:
+            digest.update('\0'.join(data[column].astype(str)).encode())
+            digest.update(b'\1')
+        return digest.hexdigest()
+
+    return tree_session.get_artifact(df, 'structure_hash', build)
+
+
+def get_layout_key(df, engine, node_ids=None):
+    """
+    Return the cache key of a layout
+    :param df: MCTS data file
+    :param engine: the name of layout engine
+    :param node_ids: sorted numpy array of the nodes kept by the min-visit cut, None for the whole tree
+    :return: hex digest
+    """
+    digest = hashlib.sha256(f'{get_structure_hash(df)}:{engine}'.encode())
+
+    if node_ids is not None:
+        digest.update(b':')
+        digest.update(np.asarray(node_ids, dtype=np.int64).tobytes())
+
+    return digest.hexdigest()
+
+
+def get_cached_layout(df, engine, builder, node_ids=None):
+    """
+    Return the positions of a layout from the layout cache, they are only computed on a cache miss
+    :param df: MCTS data file
+    :param engine: the name of layout engine
+    :param builder: function that returns 2-D numpy array of positions
+    :param node_ids: sorted numpy array of the nodes kept by the min-visit cut, None for the whole tree
+    :return: 2-D numpy array of positions
+    """
+    return layout_cache.get_positions(get_layout_key(df, engine, node_ids), builder)
@@ -0,0 +1,233 @@
+import heapq
+import numpy as np
+from utility import tree_session, tree_index, tree_layout
+
+VIEW_MODES = {
+    'threshold': 'Visit Threshold',
+    'level_of_detail': 'Level of Detail'
+}
+
+
+class SubtreeTotals:
+    """
+    The number of nodes and the total visits of the subtree under every node (the node itself included)
+    """
+    def __init__(self, sizes, visits):
+        self.sizes = sizes
+        self.visits = visits
+
+    @classmethod
+    def from_df(cls, df):
+        """
+        Accumulate the subtree totals from the deepest level up to root
+        :param df: MCTS data file
+        :return: SubtreeTotals
+        """
+        index = tree_index.get_tree_index(df)
+        sizes = np.ones(len(index))
+        visits = df['Visits'].to_numpy(dtype=np.float64).copy()
+
+        for level in reversed(index.levels[1:]):
+            sizes += np.bincount(index.parent[level], weights=sizes[level], minlength=len(index))
+            visits += np.bincount(index.parent[level], weights=visits[level], minlength=len(index))
+
+        return cls(sizes.astype(np.int64), visits)
+
+    @property
+    def nbytes(self):
+        return self.sizes.nbytes + self.visits.nbytes
+
+
+def get_subtree_totals(df):
+    """
+    Return the subtree totals of MCTS data file. They are built once for the uploaded tree.
+    :param df: MCTS data file
+    :return: SubtreeTotals
+    """
+    return tree_session.get_artifact(df, 'subtree_totals', SubtreeTotals.from_df)
+
+
+class LevelOfDetailView:
+    """
+    The nodes drawn in level of detail mode. The drawn nodes always include their ancestors, and a node whose
+    children are not all drawn stands for its whole subtree (an aggregate node). Every drawn node owns an angular
+    wedge of the radial layout, and the drawn part of its subtree is laid out inside the wedge.
+    """
+    def __init__(self, node_ids, wedge_start, wedge_size):
+        order = np.argsort(node_ids)
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)[order]
+        self.wedge_start = np.asarray(wedge_start, dtype=np.float64)[order]
+        self.wedge_size = np.asarray(wedge_size, dtype=np.float64)[order]
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def to_dict(self):
+        return {"node_ids": self.node_ids.tolist(), "wedge_start": self.wedge_start.tolist(),
+                "wedge_size": self.wedge_size.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['node_ids'], data['wedge_start'], data['wedge_size'])
+
+    def get_sub_index(self, index):
+        """
+        Return the tree index of the drawn nodes. The id of a node in it is its position in node_ids.
+        :param index: TreeIndex of MCTS data file
+        :return: TreeIndex
+        """
+        return tree_index.get_sub_index(index, self.node_ids)
+
+    def get_collapsed(self, index):
+        """
+        Return if the drawn nodes are aggregate nodes (they have children that are not drawn)
+        :param index: TreeIndex of MCTS data file
+        :return: boolean numpy array aligned with node_ids
+        """
+        return index.child_counts[self.node_ids] > self.get_sub_index(index).child_counts
+
+    def get_positions(self, index):
+        """
+        Return the positions of the drawn nodes. A node is on the ring of its depth in the middle of its wedge.
+        :param index: TreeIndex of MCTS data file
+        :return: 2-D numpy array (nodes x 2) aligned with node_ids
+        """
+        angles = self.wedge_start + self.wedge_size / 2
+        radius = index.depth[self.node_ids]
+        return np.column_stack([radius * np.cos(angles), radius * np.sin(angles)])
+
+    def layout_wedge(self, index, node_id):
+        """
+        Lay out the drawn subtree of a node again inside the wedge of the node. The wedges outside are not changed.
+        :param index: TreeIndex of MCTS data file
+        :param node_id: the id of node
+        """
+        sub_index = self.get_sub_index(index)
+        top = int(np.searchsorted(self.node_ids, node_id))
+
+        # Every drawn leaf or aggregate node under the node gets the same share of the wedge
+        descendants = get_descendants(sub_index, top)
+        leaf_counts = tree_layout.get_subtree_leaf_counts(sub_index)
+        wedge_start = tree_layout.get_wedge_starts(sub_index, leaf_counts)
+        unit = self.wedge_size[top] / leaf_counts[top]
+
+        self.wedge_start[descendants] = self.wedge_start[top] + (wedge_start[descendants] - wedge_start[top]) * unit
+        self.wedge_size[descendants] = leaf_counts[descendants] * unit
+
+    def expand(self, index, visits, node_id, budget):
+        """
+        Draw the hidden children of an aggregate node and lay out its wedge again. If the budget is not enough, the
+        least visited subtrees that are not on the path to the node are collapsed first, and only the most visited
+        children are drawn if it is still not enough.
+        :param index: TreeIndex of MCTS data file
+        :param visits: numpy array of the visits of every node
+        :param node_id: the id of aggregate node
+        :param budget: the maximum number of drawn nodes
+        :return: LevelOfDetailView
+        """
+        children = index.get_children(node_id)
+        hidden_children = children[~np.isin(children, self.node_ids)]
+
+        if hidden_children.size == 0:
+            return self
+
+        view = self.collapse_for(index, visits, node_id, budget - len(self) - hidden_children.size)
+        free = max(budget - len(view), 0)
+        hidden_children = hidden_children[np.argsort(-visits[hidden_children], kind='stable')][:free]
+
+        view = LevelOfDetailView(np.concatenate([view.node_ids, hidden_children]),
+                                 np.concatenate([view.wedge_start, np.zeros(hidden_children.size)]),
+                                 np.concatenate([view.wedge_size, np.zeros(hidden_children.size)]))
+        view.layout_wedge(index, node_id)
+        return view
+
+    def collapse_for(self, index, visits, node_id, free_nodes):
+        """
+        Collapse the least visited expanded nodes until the free budget is not negative. The node and its ancestors
+        are never collapsed.
+        :param index: TreeIndex of MCTS data file
+        :param visits: numpy array of the visits of every node
+        :param node_id: the id of node to keep expanded
+        :param free_nodes: the free budget, negative if some nodes need to be released
+        :return: LevelOfDetailView
+        """
+        if free_nodes >= 0:
+            return self
+
+        sub_index = self.get_sub_index(index)
+        is_kept = np.zeros(len(self), dtype=bool)
+        position = int(np.searchsorted(self.node_ids, node_id))
+        while position >= 0:
+            is_kept[position] = True
+            position = sub_index.parent[position]
+
+        is_removed = np.zeros(len(self), dtype=bool)
+        candidates = np.flatnonzero((sub_index.child_counts > 0) & ~is_kept)
+        for position in candidates[np.argsort(visits[self.node_ids[candidates]], kind='stable')]:
+            if free_nodes >= 0:
+                break
+            if is_removed[position]:
+                continue
+
+            descendants = get_descendants(sub_index, position)[1:]
+            is_removed[descendants] = True
+            free_nodes += descendants.size
+
+        return LevelOfDetailView(self.node_ids[~is_removed], self.wedge_start[~is_removed],
+                                 self.wedge_size[~is_removed])
+
+
+def get_descendants(index, node_id):
+    """
+    Return the node and all of its descendants
+    :param index: TreeIndex
+    :param node_id: the id of node
+    :return: numpy array of node ids
+    """
+    levels = [np.array([node_id], dtype=np.int64)]
+    while levels[-1].size:
+        levels.append(index.get_children_ids(levels[-1]))
+    return np.concatenate(levels)
+
+
+def build_level_of_detail_view(df, budget):
+    """
+    Return the initial level of detail view. Starting from root, the most visited aggregate node is expanded while
+    all of its children fit in the budget.
+    :param df: MCTS data file
+    :param budget: the maximum number of drawn nodes
+    :return: LevelOfDetailView
+    """
+    index = tree_index.get_tree_index(df)
+    visits = df['Visits'].to_numpy()
+    node_ids = [index.root]
+
+    # Max heap of the aggregate nodes by visits (ties by row order)
+    heap = [(-visits[index.root], index.root)]
+    while heap:
+        _, node_id = heapq.heappop(heap)
+        children = index.get_children(node_id)
+
+        if children.size == 0 or len(node_ids) + children.size > budget:
+            continue
+
+        node_ids.extend(children.tolist())
+        for child in children:
+            heapq.heappush(heap, (-visits[child], int(child)))
+
+    view = LevelOfDetailView(node_ids, np.zeros(len(node_ids)), np.zeros(len(node_ids)))
+    view.wedge_size[np.searchsorted(view.node_ids, index.root)] = 2 * np.pi
+    view.layout_wedge(index, index.root)
+    return view
+
+
+def expand_level_of_detail_view(df, view, node_id, budget):
+    """
+    Expand an aggregate node of the level of detail view
+    :param df: MCTS data file
+    :param view: LevelOfDetailView
+    :param node_id: the id of aggregate node
+    :param budget: the maximum number of drawn nodes
+    :return: LevelOfDetailView
+    """
+    return view.expand(tree_index.get_tree_index(df), df['Visits'].to_numpy(), node_id, budget)
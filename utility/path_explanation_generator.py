@@ -1,36 +1,64 @@
-import json
-from utility import data_preprocessing
-from utility.state import State
+from utility import data_preprocessing, feature_matrix, tree_index, tree_session, principal_variation
+from utility.state import State, StatePath
 from dash import html
+import numpy as np
+import pandas as pd
 
 
 def get_action_path(df, node_name=None, action_name=None, is_max=True,
-                    state_col='Game_Features', exclude_features=None):
-
-    action_sequences = []
-    root_node = data_preprocessing.get_root_node(df)
-    root_name = data_preprocessing.get_root_node_name(df)
-    root_state = State(json.loads(root_node[state_col]), exclude_features)
-
-    action_sequences.append(root_state)
-    if node_name:
-        filter_df = df[(df['Parent_Name'] == root_name) & (df['Name'] == node_name)]
-    elif action_name:
-        filter_df = df[(df['Parent_Name'] == root_name) & (df['Action_Name'] == action_name)]
+                    state_col='Game_Features', exclude_features=None, start_name=None):
+    """
+    Return the states along the path of always choosing the best (or worst) value child. The path starts from the
+    root child with the given node name or action name (the best or worst of all root children if neither is given),
+    or from any node given by start_name.
+    :param df: MCTS data file
+    :param node_name: the name of root child to start from
+    :param action_name: the action name of root child to start from
+    :param is_max: follow the highest value children if True, otherwise the lowest value children
+    :param state_col: the column name of features
+    :param exclude_features: the list of features will be ignored
+    :param start_name: the name of any node to start from
+    :return: StatePath from root to the last node of path
+    """
+    index = tree_index.get_tree_index(df)
+    features = feature_matrix.get_feature_matrix(df, state_col)
+
+    if start_name is not None:
+        candidates = index.get_ids([start_name]) if start_name in index.name_to_id else np.array([], dtype=np.int64)
     else:
-        filter_df = df[df['Parent_Name'] == root_name]
+        candidates = index.get_children(index.root)
+        if node_name:
+            candidates = candidates[df['Name'].values[candidates] == node_name]
+        elif action_name:
+            candidates = candidates[df['Action_Name'].values[candidates] == action_name]
+
+    if candidates.size == 0:
+        return StatePath.from_feature_matrix(features, [index.root], exclude_features)
+
+    values = pd.Series(df['Value'].values[candidates])
+    start_id = candidates[values.argmax() if is_max else values.argmin()]
+    path = principal_variation.get_principal_variation(df).get_path(start_id, is_max)
+
+    return StatePath.from_feature_matrix(features, [index.root] + path, exclude_features)
 
-    while filter_df.size:
-        if is_max:
-            current_row = filter_df.iloc[filter_df['Value'].argmax()]
-        else:
-            current_row = filter_df.iloc[filter_df['Value'].argmin()]
-        current_state = State(json.loads(current_row[state_col]), exclude_features)
-        current_name = current_row['Name']
-        action_sequences.append(current_state)
-        filter_df = df[df['Parent_Name'] == current_name]
 
-    return action_sequences
+def get_top_k_action_paths(df, k=3, is_max=True, state_col='Game_Features', exclude_features=None):
+    """
+    Return the k best (or worst) value paths under every root action. The paths are ranked by the values along them,
+    so the first path of an action is the path of get_action_path from that action.
+    :param df: MCTS data file
+    :param k: the number of paths for every root action
+    :param is_max: rank the highest values first if True, otherwise the lowest values first
+    :param state_col: the column name of features
+    :param exclude_features: the list of features will be ignored
+    :return: dictionary of root action node name and the list of paths (StatePath from root)
+    """
+    index = tree_index.get_tree_index(df)
+    features = feature_matrix.get_feature_matrix(df, state_col)
+
+    return {index.names[node_id]: [StatePath.from_feature_matrix(features, [index.root] + path, exclude_features)
+                                   for path in paths]
+            for node_id, paths in principal_variation.get_top_k_root_action_paths(df, k, is_max).items()}
 
 
 def get_path_feature_difference(path, rel_tol=0.0001):
@@ -47,6 +75,20 @@ def get_path_feature_difference(path, rel_tol=0.0001):
     return feature_differences, percentage_differences
 
 
+def get_paths_feature_difference(paths, rel_tol=0.0001):
+    """
+    Return the average feature difference between the last state and root over several paths from the same root
+    :param paths: the list of StatePath from root
+    :param rel_tol: the minimum difference that is reported
+    :return: feature differences, percentage differences
+    """
+    # The features missing in any of the last states are NaN in the average
+    last_values = np.stack([path.values[-1] for path in paths])
+    average_state = State(feature_names=paths[0].feature_names, values=last_values.mean(axis=0))
+
+    return get_path_feature_difference([paths[0][0], average_state], rel_tol)
+
+
 def generate_explanation(feature_tuple, direction):
     if len(feature_tuple) == 0:
         return []
@@ -141,17 +183,20 @@ def generate_explanation_list(features_differences, percentage_differences,
 
 
 def classify_features(features_A, features_B):
-    common_features = set()
-    for feature in features_A.keys() & features_B.keys():
+    # The features are kept in the order of the feature columns, so the explanation text does not depend on set order
+    common_features = []
+    for feature in features_A:
+        if feature not in features_B:
+            continue
         ba_differences = features_A[feature]
         wa_differences = features_B[feature]
         if ba_differences == 'infinite' or wa_differences == 'infinite':
             if ba_differences == wa_differences:
-                common_features.add(feature)
+                common_features.append(feature)
         elif (ba_differences > 0 and wa_differences > 0) or (ba_differences < 0 and wa_differences < 0):
-            common_features.add(feature)
-    features_A_exclude_list = features_A.keys() - common_features
-    features_B_exclude_list = features_B.keys() - common_features
+            common_features.append(feature)
+    features_A_exclude_list = [feature for feature in features_A if feature not in common_features]
+    features_B_exclude_list = [feature for feature in features_B if feature not in common_features]
     return common_features, features_A_exclude_list, features_B_exclude_list
 
 
@@ -247,6 +292,198 @@ def explanation_by_paths(df, state_col='Game_Features', exclude_features=None):
     return explanations
 
 
+def top_k_explanation_by_paths(df, k=3, state_col='Game_Features', exclude_features=None):
+    """
+    Summarise the average feature changes over the k best value paths of the best action
+    :param df: MCTS data file
+    :param k: the number of paths
+    :param state_col: the column name of features
+    :param exclude_features: the list of features will be ignored
+    :return: explanation list, empty if the best action has only one path
+    """
+    best_action_name = data_preprocessing.get_root_best_action(df)
+    index = tree_index.get_tree_index(df)
+    action_paths = get_top_k_action_paths(df, k, state_col=state_col, exclude_features=exclude_features)
+
+    # The root child of the best action with the highest value like get_action_path
+    candidates = [name for name in action_paths if df['Action_Name'].values[index.name_to_id[name]] == best_action_name]
+    if not candidates:
+        return []
+
+    paths = action_paths[max(candidates, key=lambda name: df['Value'].values[index.name_to_id[name]])]
+    if len(paths) < 2:
+        return []
+
+    feature_differences, percentage_differences = get_paths_feature_difference(paths)
+
+    explanations = [html.Br(), html.Br(),
+                    f"Averaged over the {len(paths)} best simulated lines of {best_action_name}, "
+                    f"the features change as follows. "]
+    feature_explanation = generate_explanation_list(feature_differences, percentage_differences)
+
+    if len(feature_explanation) == 0:
+        explanations.append(f"It is expected that all features will remain unchanged in the future state. ")
+        return explanations
+
+    return explanations + feature_explanation
+
+
+class CounterfactualMatrix:
+    """
+    The best value paths of all root actions and the feature changes of every pair of them. A pair is compared
+    on the paths shortened to the shorter one, like the counterfactual explanation. changes[i, j, f] is the change of
+    feature f at the end of the path of action i when compared with action j.
+    """
+    def __init__(self, actions, paths, root_path, rel_tol=0.0001):
+        self.actions = list(actions)
+        self.action_index = {action: idx for idx, action in enumerate(self.actions)}
+        self.paths = paths
+        self.root_path = root_path
+        self.rel_tol = rel_tol
+        self.feature_names = root_path.feature_names
+
+        lengths = np.array([len(path) for path in paths], dtype=np.int64)
+        self.path_lengths = np.minimum.outer(lengths, lengths)
+
+        # Pad the paths with their last state so the rows of every pair can be taken at once
+        padded = np.stack([np.concatenate([path.values, np.repeat(path.values[-1:], lengths.max() - len(path), 0)])
+                           for path in paths]) if paths else np.zeros((0, 0, len(self.feature_names)))
+        self.changes = padded[np.arange(len(paths))[:, None], self.path_lengths - 1] - root_path.values[0]
+
+        with np.errstate(invalid='ignore'):
+            self.signs = np.where(np.abs(self.changes) > rel_tol, np.sign(self.changes), 0).astype(np.int8)
+
+    @classmethod
+    def from_df(cls, df, state_col='Game_Features', rel_tol=0.0001):
+        """
+        Compute the best value path of every root action once
+        :param df: MCTS data file
+        :param state_col: the column name of features
+        :param rel_tol: the minimum difference that is counted as a change
+        :return: CounterfactualMatrix
+        """
+        index = tree_index.get_tree_index(df)
+        actions = pd.unique(df['Action_Name'].values[index.get_children(index.root)])
+        paths = [get_action_path(df, action_name=action, state_col=state_col) for action in actions]
+        root_path = StatePath.from_feature_matrix(feature_matrix.get_feature_matrix(df, state_col), [index.root])
+
+        return cls(actions, paths, root_path, rel_tol)
+
+    @property
+    def nbytes(self):
+        return self.changes.nbytes + self.signs.nbytes + sum(path.values.nbytes for path in self.paths)
+
+    def get_path_length(self, action_a, action_b):
+        """
+        Return the length of the paths of two root actions shortened to the shorter one
+        :param action_a: the first action name
+        :param action_b: the second action name
+        :return: the number of states
+        """
+        # The path of an action that is not available has only root like get_action_path
+        if action_a not in self.action_index or action_b not in self.action_index:
+            return 1
+        return int(self.path_lengths[self.action_index[action_a], self.action_index[action_b]])
+
+    def get_feature_difference(self, action_a, action_b, exclude_features=None):
+        """
+        Return the feature changes at the end of the path of action_a when compared with action_b, like
+        get_path_feature_difference on the shortened path
+        :param action_a: the first action name
+        :param action_b: the second action name
+        :param exclude_features: the list of features will be ignored
+        :return: feature differences, percentage differences
+        """
+        if action_a not in self.action_index or action_b not in self.action_index:
+            return {}, {}
+
+        a, b = self.action_index[action_a], self.action_index[action_b]
+        changes, root_values = self.changes[a, b], self.root_path.values[0]
+        is_changed = (self.signs[a, b] != 0) & ~np.isin(self.feature_names, exclude_features or [])
+
+        # The percentage is undefined for the features that are zero in root
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percentages = 100 * changes / np.abs(root_values)
+
+        feature_differences = {}
+        percentage_differences = {}
+        for idx in np.flatnonzero(is_changed):
+            name = self.feature_names[idx]
+            feature_differences[name] = float(changes[idx])
+            if abs(root_values[idx]) < 0.0001:
+                percentage_differences[name] = 'increase' if changes[idx] > 0 else 'decrease'
+            else:
+                percentage_differences[name] = float(percentages[idx])
+
+        return feature_differences, percentage_differences
+
+    def get_comparison(self, action_a, action_b, exclude_features=None):
+        """
+        Classify the features changed by two root actions like classify_features, in the order of feature columns
+        :param action_a: the first action name
+        :param action_b: the second action name
+        :param exclude_features: the list of features will be ignored
+        :return: the lists of feature names changed in the same direction, changed differently by action_a (only by
+                 action_a or in the opposite direction) and changed differently by action_b
+        """
+        if action_a not in self.action_index or action_b not in self.action_index:
+            return [], [], []
+
+        a, b = self.action_index[action_a], self.action_index[action_b]
+        sign_a, sign_b = self.signs[a, b], self.signs[b, a]
+        mask = ~np.isin(self.feature_names, exclude_features or [])
+        names = np.asarray(self.feature_names, dtype=object)
+        is_common = mask & (sign_a != 0) & (sign_a == sign_b)
+
+        return (names[is_common].tolist(),
+                names[mask & (sign_a != 0) & ~is_common].tolist(),
+                names[mask & (sign_b != 0) & ~is_common].tolist())
+
+    def get_difference_counts(self, exclude_features=None):
+        """
+        Return the number of features that change differently for every pair of root actions (changed by only one
+        of them or in opposite directions)
+        :param exclude_features: the list of features will be ignored
+        :return: 2-D numpy array (actions x actions)
+        """
+        mask = ~np.isin(self.feature_names, exclude_features or [])
+        signs = self.signs[:, :, mask]
+        return (signs != signs.transpose(1, 0, 2)).sum(axis=2)
+
+
+def get_counterfactual_matrix(df, state_col='Game_Features'):
+    """
+    Return the counterfactual matrix of root actions. It is built once per feature column for the uploaded tree.
+    :param df: MCTS data file
+    :param state_col: the column name of features
+    :return: CounterfactualMatrix
+    """
+    return tree_session.get_artifact(df, ('counterfactual_matrix', state_col),
+                                     lambda data: CounterfactualMatrix.from_df(data, state_col))
+
+
+def rank_actions_by_outcome_difference(df, action_name=None, state_col='Game_Features', exclude_features=None):
+    """
+    Rank the root actions by how differently their best value paths change the features compared with an action
+    :param df: MCTS data file
+    :param action_name: the action to compare with, the best action if None
+    :param state_col: the column name of features
+    :param exclude_features: the list of features will be ignored
+    :return: the list of (action name, number of differently changed features), the most different first
+    """
+    matrix = get_counterfactual_matrix(df, state_col)
+
+    if action_name is None:
+        action_name = data_preprocessing.get_root_best_action(df)
+    if action_name not in matrix.action_index:
+        return []
+
+    counts = matrix.get_difference_counts(exclude_features)[matrix.action_index[action_name]]
+    order = np.argsort(-counts, kind='stable')
+
+    return [(matrix.actions[idx], int(counts[idx])) for idx in order if matrix.actions[idx] != action_name]
+
+
 def counterfactual_explanation_by_paths(df, action_name=None, exclude_features=None, state_col='Game_Features'):
     explanations = []
     # Get the root node name and action space
@@ -288,21 +525,15 @@ def counterfactual_explanation_by_paths(df, action_name=None, exclude_features=N
 
     explanations.append(f"The following counterfactual explanation is based on {best_action_name} and {action_name}.")
 
-    # Get the best value path of best action
-    best_action_paths = get_action_path(df, action_name=best_action_name,
-                                        exclude_features=exclude_features, state_col=state_col)
+    # Look up the best value paths of best action and selected action (or second-highest value action) shortened to
+    # the shorter one
+    matrix = get_counterfactual_matrix(df, state_col)
+    path_len = matrix.get_path_length(best_action_name, action_name)
 
-    # Get the best value path of selected action (or second-highest value action)
-    comparison_action_paths = get_action_path(df, action_name=action_name,
-                                              exclude_features=exclude_features, state_col=state_col)
-
-    # Get path length and shorten the path
-    path_len = min(len(best_action_paths), len(comparison_action_paths))
-    best_action_paths = best_action_paths[:path_len]
-    comparison_action_paths = comparison_action_paths[:path_len]
-
-    ba_feature_differences, ba_percentage_differences = get_path_feature_difference(best_action_paths)
-    ca_feature_differences, ca_percentage_differences = get_path_feature_difference(comparison_action_paths)
+    ba_feature_differences, ba_percentage_differences = matrix.get_feature_difference(best_action_name, action_name,
+                                                                                      exclude_features)
+    ca_feature_differences, ca_percentage_differences = matrix.get_feature_difference(action_name, best_action_name,
+                                                                                      exclude_features)
 
     # Get the number of executed actions in the path
     if path_len == 1:
@@ -333,8 +564,8 @@ def counterfactual_explanation_by_paths(df, action_name=None, exclude_features=N
                         "different outcomes.")
 
     # Classify the features
-    common_features, ba_exclude_features, ca_exclude_features = classify_features(ba_feature_differences,
-                                                                                  ca_feature_differences)
+    common_features, ba_exclude_features, ca_exclude_features = matrix.get_comparison(best_action_name, action_name,
+                                                                                      exclude_features)
 
     if len(common_features):
         feature_explanation = generate_explanation_list(ba_feature_differences, ba_percentage_differences,
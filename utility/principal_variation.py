@@ -0,0 +1,175 @@
+import numpy as np
+from utility import tree_session, tree_index
+
+
+def get_children_arg_value(index, values, is_max=True):
+    """
+    Return the child with the highest (or lowest) value of every node. Ties are broken by the row order of the
+    children and missing values are never selected unless all the children are missing, then the last child is
+    selected like pandas argmax.
+    :param index: TreeIndex
+    :param values: numpy array of node values aligned with node ids
+    :param is_max: select the highest value if True, otherwise the lowest value
+    :return: numpy array of child ids (-1 if the node is a leaf)
+    """
+    selected = np.full(len(index), -1, dtype=np.int64)
+
+    if index.child_ids.size == 0:
+        return selected
+
+    children = index.child_ids
+    parents = index.parent[children]
+    child_values = values[children].astype(np.float64)
+    is_missing = np.isnan(child_values)
+    keys = np.where(is_missing, -np.inf if is_max else np.inf, child_values)
+
+    # Sort the children by parent, then value, then their order among siblings and take the first of every parent
+    order = np.lexsort((np.arange(children.size), -keys if is_max else keys, parents))
+    group_starts = np.flatnonzero(np.r_[True, parents[order][1:] != parents[order][:-1]])
+    selected[parents[order][group_starts]] = children[order][group_starts]
+
+    # All the children are missing
+    missing_counts = np.bincount(parents, weights=is_missing, minlength=len(index))
+    all_missing = np.flatnonzero((missing_counts == index.child_counts) & (index.child_counts > 0))
+    selected[all_missing] = index.child_ids[index.child_offsets[all_missing + 1] - 1]
+
+    return selected
+
+
+def get_ranked_children(index, values, selected, is_max=True):
+    """
+    Rank the children of every node from the best to the worst by value. The selected child of get_children_arg_value
+    is always ranked first, the other children follow by value and then their order among siblings.
+    :param index: TreeIndex
+    :param values: numpy array of node values aligned with node ids
+    :param selected: numpy array of the selected child of every node
+    :param is_max: rank the highest value first if True, otherwise the lowest value first
+    :return: numpy array of child ids grouped like the CSR children of the tree index
+    """
+    children = index.child_ids
+    parents = index.parent[children]
+    child_values = values[children].astype(np.float64)
+    keys = np.where(np.isnan(child_values), -np.inf if is_max else np.inf, child_values)
+
+    order = np.lexsort((np.arange(children.size), -keys if is_max else keys, children != selected[parents], parents))
+    return children[order]
+
+
+def get_first_children(child_offsets, ranked):
+    """
+    Return the first ranked child of every node
+    :param child_offsets: CSR offsets of the children
+    :param ranked: numpy array of ranked child ids
+    :return: numpy array of child ids (-1 if the node is a leaf)
+    """
+    first_children = np.full(len(child_offsets) - 1, -1, dtype=np.int64)
+    has_children = child_offsets[1:] > child_offsets[:-1]
+    first_children[has_children] = ranked[child_offsets[:-1][has_children]]
+    return first_children
+
+
+class PrincipalVariation:
+    """
+    The children of every node ranked by Value from the best and from the worst. Following the first ranked child
+    from a node gives the path of always choosing the best (or worst) action in O(depth), and walking the ranked
+    children in order enumerates the next best paths.
+    """
+    def __init__(self, child_offsets, best_ranked, worst_ranked):
+        self.child_offsets = child_offsets
+        self.best_ranked = best_ranked
+        self.worst_ranked = worst_ranked
+
+        self.best_child = get_first_children(child_offsets, best_ranked)
+        self.worst_child = get_first_children(child_offsets, worst_ranked)
+
+    @classmethod
+    def from_df(cls, df):
+        """
+        Rank the children of every node by the Value column
+        :param df: MCTS data file
+        :return: PrincipalVariation
+        """
+        index = tree_index.get_tree_index(df)
+        values = df['Value'].to_numpy(dtype=np.float64)
+        best_ranked = get_ranked_children(index, values, get_children_arg_value(index, values, True), True)
+        worst_ranked = get_ranked_children(index, values, get_children_arg_value(index, values, False), False)
+        return cls(index.child_offsets, best_ranked, worst_ranked)
+
+    @property
+    def nbytes(self):
+        arrays = [self.child_offsets, self.best_ranked, self.worst_ranked, self.best_child, self.worst_child]
+        return sum(array.nbytes for array in arrays)
+
+    def get_path(self, node_id, is_max=True):
+        """
+        Return the path from a node by always choosing the best (or worst) child until a leaf
+        :param node_id: the id of the first node
+        :param is_max: follow the best child if True, otherwise the worst child
+        :return: list of node ids starting from node_id
+        """
+        pointers = self.best_child if is_max else self.worst_child
+        path = [node_id]
+
+        while pointers[path[-1]] >= 0:
+            path.append(int(pointers[path[-1]]))
+
+        return path
+
+    def get_top_k_paths(self, node_id, k=1, is_max=True):
+        """
+        Return the k best (or worst) paths from a node to leaves. Paths are ranked by the values along them from the
+        first node down, so the first path is the path of get_path. Only the nodes on the returned paths and
+        their ancestors are visited.
+        :param node_id: the id of the first node
+        :param k: the number of paths
+        :param is_max: rank the highest values first if True, otherwise the lowest values first
+        :return: list of paths, every path is a list of node ids starting from node_id
+        """
+        ranked = self.best_ranked if is_max else self.worst_ranked
+        offsets = self.child_offsets
+        paths = []
+
+        # Depth-first search that visits the children in ranked order, cursors hold the next child to visit
+        path, cursors = [int(node_id)], [offsets[node_id]]
+        while path and len(paths) < k:
+            node, cursor = path[-1], cursors[-1]
+
+            if offsets[node] == offsets[node + 1]:
+                paths.append(list(path))
+            elif cursor < offsets[node + 1]:
+                cursors[-1] += 1
+                child = int(ranked[cursor])
+                path.append(child)
+                cursors.append(offsets[child])
+                continue
+
+            path.pop()
+            cursors.pop()
+
+        return paths
+
+
+def get_principal_variation(df):
+    """
+    Return the ranked children of MCTS data file. They are built once for the uploaded tree.
+    :param df: MCTS data file
+    :return: PrincipalVariation
+    """
+    return tree_session.get_artifact(df, 'principal_variation', PrincipalVariation.from_df)
+
+
+def get_top_k_root_action_paths(df, k=1, is_max=True):
+    """
+    Return the k best (or worst) paths under every root action. They are cached per tree and k.
+    :param df: MCTS data file
+    :param k: the number of paths for every root action
+    :param is_max: rank the highest values first if True, otherwise the lowest values first
+    :return: dictionary of root action node id and the list of paths (lists of node ids from the root action)
+    """
+    def build(data):
+        index = tree_index.get_tree_index(data)
+        variation = get_principal_variation(data)
+        return {int(node_id): variation.get_top_k_paths(node_id, k, is_max)
+                for node_id in index.get_children(index.root)}
+
+    return tree_session.get_artifact(df, ('top_k_paths', k, is_max), build)
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 
 def square_rooted(x):
@@ -19,6 +20,55 @@ def cosine_similarity(x, y):
     return round(numerator / float(denominator), 3)
 
 
+def batch_square_rooted(matrix):
+    total = np.zeros(matrix.shape[0])
+    for column in matrix.T:
+        total += column * column
+    return np.round(np.sqrt(total), 3)
+
+
+def batch_euclidean_distance(x, matrix):
+    """
+    Euclidean distance between x and every row of matrix. Features are summed in order like euclidean_distance.
+    :param x: 1-D numpy array of features
+    :param matrix: 2-D numpy array (nodes x features)
+    :return: 1-D numpy array of distances
+    """
+    total = np.zeros(matrix.shape[0])
+    for a, column in zip(x, matrix.T):
+        total += (a - column) ** 2
+    return np.sqrt(total)
+
+
+def batch_manhattan_distance(x, matrix):
+    """
+    Manhattan distance between x and every row of matrix
+    :param x: 1-D numpy array of features
+    :param matrix: 2-D numpy array (nodes x features)
+    :return: 1-D numpy array of distances
+    """
+    total = np.zeros(matrix.shape[0])
+    for a, column in zip(x, matrix.T):
+        total += np.abs(a - column)
+    return total
+
+
+def batch_cosine_similarity(x, matrix):
+    """
+    Cosine similarity between x and every row of matrix, rounded like cosine_similarity
+    :param x: 1-D numpy array of features
+    :param matrix: 2-D numpy array (nodes x features)
+    :return: 1-D numpy array of similarities
+    """
+    numerator = np.zeros(matrix.shape[0])
+    for a, column in zip(x, matrix.T):
+        numerator += a * column
+    denominator = square_rooted(x) * batch_square_rooted(matrix)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.round(numerator / denominator, 3)
+
+
 def jaccard(x, y):
     if not x and not y:
         return 1
@@ -43,14 +93,57 @@ def overlap_coefficient(x, y):
     return len(set(x) & set(y)) / (min(len(x), len(y)))
 
 
+def batch_jaccard(intersections, x_length, y_lengths):
+    """
+    Jaccard similarity between x and every set from the sizes of intersections and the lengths of the lists
+    :param intersections: numpy array of the number of common elements
+    :param x_length: the length of x
+    :param y_lengths: numpy array of the lengths of the other lists
+    :return: numpy array of similarities
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = intersections / (x_length + y_lengths - intersections)
+    return np.where((x_length == 0) & (y_lengths == 0), 1, values)
+
+
+def batch_sorenson_dice(intersections, x_length, y_lengths):
+    """
+    Sorenson-Dice similarity between x and every set, see batch_jaccard
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = 2 * intersections / (x_length + y_lengths)
+    return np.where((x_length == 0) & (y_lengths == 0), 1, values)
+
+
+def batch_overlap_coefficient(intersections, x_length, y_lengths):
+    """
+    Overlap coefficient between x and every set, see batch_jaccard
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = intersections / np.minimum(x_length, y_lengths)
+    return np.where((x_length == 0) | (y_lengths == 0), 1, values)
+
+
 distance_similarity_function_dict = {
     "Euclidean": euclidean_distance,
     "Manhattan": manhattan_distance,
     "Cosine": cosine_similarity
 }
 
+batch_distance_similarity_function_dict = {
+    "Euclidean": batch_euclidean_distance,
+    "Manhattan": batch_manhattan_distance,
+    "Cosine": batch_cosine_similarity
+}
+
 set_similarity_function_dict = {
     'Jaccard': jaccard,
     'Sorenson-Dice': sorenson_dice,
     'Overlap Coefficient': overlap_coefficient
 }
+
+batch_set_similarity_function_dict = {
+    'Jaccard': batch_jaccard,
+    'Sorenson-Dice': batch_sorenson_dice,
+    'Overlap Coefficient': batch_overlap_coefficient
+}
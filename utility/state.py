@@ -1,49 +1,119 @@
-import math
+import numpy as np
 
 
 class State:
-    def __init__(self, features_dict, exclude_features=None):
-        self.features_dict = features_dict
-        if exclude_features:
-            for feature in exclude_features:
-                if feature in self.features_dict:
-                    self.features_dict.pop(feature)
+    """
+    The features of a node as a vector over a feature name list. The name list is shared by all the states of the
+    same tree, missing and excluded features are NaN.
+    """
+    __slots__ = ('feature_names', 'values')
 
-    def distance(self, state):
-        distance = 0
-        for key, feature in self.feautres_dict.items():
-            distance += (state.features_dict[key] - feature) ** 2
+    def __init__(self, features_dict=None, exclude_features=None, feature_names=None, values=None):
+        if values is None:
+            features_dict = dict(features_dict or {})
+            if exclude_features:
+                for feature in exclude_features:
+                    features_dict.pop(feature, None)
+            feature_names = list(features_dict)
+            values = list(features_dict.values())
 
-        return math.sqrt(distance)
+        self.feature_names = feature_names
+        self.values = np.asarray(values, dtype=np.float64)
 
-    def feature_difference(self, state):
-        difference_dict = {}
-        for key, feature in self.features_dict.items():
-            difference_dict[key] = feature - state.features_dict[key]
+    @property
+    def features_dict(self):
+        return {name: float(value) for name, value in zip(self.feature_names, self.values) if not np.isnan(value)}
+
+    def aligned_values(self, state):
+        """
+        Return the values of another state in the order of the feature names of this state
+        :param state: State
+        :return: numpy array of feature values (NaN if the other state does not have the feature)
+        """
+        if state.feature_names is self.feature_names:
+            return state.values
 
-        return difference_dict
+        feature_index = {name: idx for idx, name in enumerate(state.feature_names)}
+        return np.array([state.values[feature_index[name]] if name in feature_index else np.nan
+                         for name in self.feature_names])
+
+    def difference(self, state):
+        """
+        Return the feature differences from another state
+        :param state: State
+        :return: numpy array of differences (NaN if any of the states does not have the feature)
+        """
+        return self.values - self.aligned_values(state)
+
+    def distance(self, state):
+        differences = self.difference(state)
+        return float(np.sqrt(np.sum(differences[~np.isnan(self.values)] ** 2)))
+
+    def feature_difference(self, state):
+        return {name: float(difference) for name, value, difference in
+                zip(self.feature_names, self.values, self.difference(state)) if not np.isnan(value)}
 
     def percentage_difference(self, state):
+        state_values = self.aligned_values(state)
+        differences = self.values - state_values
+
+        # The percentage is undefined for the features that are zero in the other state
+        is_zero = np.abs(state_values) < 0.0001
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percentages = 100 * differences / np.abs(state_values)
+
         percentage_dict = {}
-        for key, feature in self.features_dict.items():
-            difference = feature - state.features_dict[key]
-            if abs(state.features_dict[key]) < 0.0001:
-                if difference > 0:
-                    percentage_dict[key] = 'increase'
-                else:
-                    percentage_dict[key] = 'decrease'
+        for name, value, difference, percentage, zero in zip(self.feature_names, self.values, differences, percentages,
+                                                             is_zero):
+            if np.isnan(value):
+                continue
+            if zero:
+                percentage_dict[name] = 'increase' if difference > 0 else 'decrease'
             else:
-                percentage_dict[key] = 100 * difference / abs(state.features_dict[key])
+                percentage_dict[name] = float(percentage)
         return percentage_dict
 
     def feature_change(self, state):
-        feature_change_dict = {}
-        for key, feature in self.features_dict.items():
-            feature_change_dict[key] = [state.features_dict[key], feature]
-        return feature_change_dict
+        return {name: [float(state_value), float(value)] for name, value, state_value in
+                zip(self.feature_names, self.values, self.aligned_values(state)) if not np.isnan(value)}
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
             return self.features_dict == other.features_dict
         else:
-            return False
\ No newline at end of file
+            return False
+
+
+class StatePath:
+    """
+    The states along a path as one 2-D array (states x features) over a shared feature name list
+    """
+    __slots__ = ('feature_names', 'values')
+
+    def __init__(self, feature_names, values):
+        self.feature_names = feature_names
+        self.values = np.asarray(values, dtype=np.float64).reshape(-1, len(feature_names))
+
+    @classmethod
+    def from_feature_matrix(cls, features, node_ids, exclude_features=None):
+        """
+        Return the states of the nodes from the feature matrix
+        :param features: FeatureMatrix
+        :param node_ids: the list of node ids (rows of the feature matrix)
+        :param exclude_features: the list of features will be ignored
+        :return: StatePath
+        """
+        values = features.values[np.asarray(node_ids, dtype=np.int64)]
+        values[:, ~features.feature_mask(exclude_features)] = np.nan
+        return cls(features.feature_names, values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return StatePath(self.feature_names, self.values[item])
+        return State(feature_names=self.feature_names, values=self.values[item])
+
+    def __iter__(self):
+        return (self[idx] for idx in range(len(self)))
@@ -7,8 +7,11 @@ class StoreData:
         self.store_id = store_id
 
 
-df = StoreData('dataframe', {"file_id": None, "file": None})
+df = StoreData('dataframe', {"file_id": None})
 fig_filename = StoreData("fig_filename", None)
+fig_layout = StoreData("fig_layout", None)
 custom_symbols = StoreData('custom_symbols', [])
 selected_node = StoreData('selected_node', None)
-feature_explanation_df = StoreData("feature_explanation_df", {"df": None, "max_depth": 0})
+feature_explanation_df = StoreData("feature_explanation_df", {"cube": None, "max_depth": 0})
+level_of_detail_view = StoreData("level_of_detail_view", None)
+session_expired = StoreData("session_expired", None)
@@ -1,12 +1,21 @@
 import plotly
 import json
 import plotly.graph_objects as go
-import networkx as nx
 import plotly.express as px
 from utility.attributes import get_attributes, get_legend_attributes
-from utility import data_preprocessing
+from utility import data_preprocessing, tree_index, tree_layout, level_of_detail
 import numpy as np
+import pandas as pd
+from dash import Patch
 
+DEFAULT_MAX_NODES = 500
+WEBGL_NODE_THRESHOLD = 1000
+
+RENDER_MODES = {
+    'auto': 'Auto',
+    'svg': 'SVG',
+    'webgl': 'WebGL'
+}
 
 def get_figure_object(fig):
     """
@@ -21,21 +30,66 @@ def get_figure_object(fig):
     return fig
 
 
-def get_figure_custom_data_by_node_name(fig, node_name):
-    fig = get_figure_object(fig)
-    custom_data = fig.data[1]['customdata']
+def get_node_custom_data(df, node_id):
+    """
+    Return the attributes of a node from MCTS data file
+    :param df: MCTS data file
+    :param node_id: the id of node (row position in MCTS data file)
+    :return: dictionary of node attributes
+    """
+    node_id = int(node_id)
+    data = {"Name": df['Name'].iat[node_id]}
 
-    for data in custom_data:
-        if data['Name'] == node_name:
-            return data
-    return None
+    for attribute in get_attributes(df):
+        value = df[attribute].iat[node_id]
+        data[attribute] = value.item() if isinstance(value, np.generic) else value
 
+    return data
 
-def highlight_selected_node(fig, df, node_name, visit_threshold):
-    fig = get_figure_object(fig)
-    custom_data = fig.data[1]['customdata']
-    opacity = []
-    sizes = []
+
+def resolve_custom_data(df, custom_data):
+    """
+    Return the node attributes of a point on the figure. The custom data of a point is its node id.
+    :param df: MCTS data file
+    :param custom_data: the custom data of point
+    :return: dictionary of node attributes
+    """
+    return get_node_custom_data(df, custom_data)
+
+
+def get_figure_custom_data_by_node_name(df, node_name):
+    """
+    Return the custom data of a node by its name
+    :param df: MCTS data file
+    :param node_name: the name of node
+    :return: dictionary of node attributes, None if the node does not exist
+    """
+    index = tree_index.get_tree_index(df)
+
+    if node_name not in index.name_to_id:
+        return None
+    return get_node_custom_data(df, index.get_id(node_name))
+
+
+def get_figure_node_ids(df, min_visit_threshold=0):
+    """
+    Return the ids of nodes drawn on the figure. The i-th marker of the node trace is the node node_ids[i].
+    :param df: MCTS data file
+    :param min_visit_threshold: the minimum visit threshold of the figure
+    :return: numpy array of node ids
+    """
+    return np.flatnonzero((df['Visits'] >= (min_visit_threshold or 0)).to_numpy())
+
+
+def get_highlight_marker(df, node_ids, node_name, visit_threshold):
+    """
+    Return the marker properties that highlight the selected node and its best child
+    :param df: MCTS data file
+    :param node_ids: the ids of nodes drawn on the figure
+    :param node_name: the name of selected node
+    :param visit_threshold: the visit threshold
+    :return: dictionary of marker properties
+    """
     child_node_name = None
 
     children_list = data_preprocessing.get_node_available_actions(df, node_name)
@@ -46,113 +100,131 @@ def highlight_selected_node(fig, df, node_name, visit_threshold):
             child_node_name = child
             break
 
-    for data in custom_data:
-        if data['Name'] == node_name:
-            opacity.append(1)
-            sizes.append(20)
-        else:
-            if child_node_name is not None and data['Name'] == child_node_name:
-                sizes.append(15)
-            else:
-                sizes.append(10)
-
-            if data['Visits'] >= visit_threshold:
-                opacity.append(0.6)
-            else:
-                opacity.append(0.2)
-
-    fig.data[1].update(
-        marker={"opacity": opacity,
-                "size": sizes})
-    return fig
+    names = df['Name'].to_numpy()[node_ids]
+    visits = df['Visits'].to_numpy()[node_ids]
+    is_selected = names == node_name
 
+    opacity = np.where(is_selected, 1, np.where(visits >= visit_threshold, 0.6, 0.2))
+    sizes = np.where(is_selected, 20, np.where(names == child_node_name, 15, 10)) \
+        if child_node_name is not None else np.where(is_selected, 20, 10)
 
-def update_opacity(fig, threshold):
-    fig = get_figure_object(fig)
-    custom_data = fig.data[1]['customdata']
-    fig.data[1].update(
-        marker={"opacity": [1 if i['Visits'] >= threshold else 0.2 for i in custom_data], "size": [10 for _ in custom_data]})
-    return fig
+    return {"opacity": opacity.tolist(), "size": sizes.tolist()}
 
 
-def generate_network(df):
-    dag = nx.from_pandas_edgelist(df, source='Name', target='Parent_Name')
-    dag.remove_node("None")
+def get_opacity_marker(df, node_ids, threshold):
+    """
+    Return the marker properties that fade out the nodes visited less than the threshold
+    :param df: MCTS data file
+    :param node_ids: the ids of nodes drawn on the figure
+    :param threshold: the visit threshold
+    :return: dictionary of marker properties
+    """
+    visits = df['Visits'].to_numpy()[node_ids]
+    return {"opacity": np.where(visits >= threshold, 1, 0.2).tolist(), "size": [10] * len(node_ids)}
 
-    # Change the position of node and edge
-    pos = nx.nx_agraph.graphviz_layout(dag, prog='twopi')
-    for n, p in pos.items():
-        dag.nodes[n]['pos'] = p
 
-    # Put the attributes of node into network
-    attributes = get_attributes(df)
-    for x in df["Name"]:
-        dag.nodes[x]["Name"] = x
-        if attributes:
-            for attribute in attributes:
-                dag.nodes[x][attribute] = df[df["Name"] == x][attribute].values[0]
+def update_node_marker(fig, marker):
+    """
+    Update the marker properties of the node trace
+    :param fig: Figure
+    :param marker: dictionary of marker properties
+    :return: Figure
+    """
+    fig = get_figure_object(fig)
+    fig.data[1].update(marker=marker)
+    return fig
 
-    return dag
 
+def patch_node_marker(marker):
+    """
+    Return the partial update of the marker properties of the node trace. Only these properties are sent to the
+    browser instead of the whole figure.
+    :param marker: dictionary of marker properties
+    :return: Patch
+    """
+    patched_fig = Patch()
+    for key, value in marker.items():
+        patched_fig['data'][1]['marker'][key] = value
+    return patched_fig
 
-def get_edge_pos(graph):
-    edge_x = []
-    edge_y = []
 
-    for edge in graph.edges():
-        x0, y0 = graph.nodes[edge[0]]['pos']
-        x1, y1 = graph.nodes[edge[1]]['pos']
-        edge_x.append(x0)
-        edge_x.append(x1)
-        edge_x.append(None)
-        edge_y.append(y0)
-        edge_y.append(y1)
-        edge_y.append(None)
+def get_payload_nbytes(output):
+    """
+    Return the number of bytes of callback output serialised for the browser
+    :param output: Figure, Patch or json-compatible object
+    :return: the number of bytes
+    """
+    if isinstance(output, Patch):
+        output = output.to_plotly_json()
+    return len(plotly.io.json.to_json_plotly(output).encode())
 
-    return edge_x, edge_y
 
+def get_edge_pos(df, node_ids, positions):
+    """
+    Return the line segments from the drawn nodes to their parents. A node is connected to its parent if the parent
+    is also drawn, and the segments are separated by NaN.
+    :param df: MCTS data file
+    :param node_ids: sorted numpy array of the ids of drawn nodes
+    :param positions: 2-D numpy array (nodes x 2) of positions aligned with node_ids
+    :return: numpy arrays of x positions and y positions
+    """
+    sub_index = tree_index.get_sub_index(tree_index.get_tree_index(df), node_ids)
+    children = np.flatnonzero(sub_index.parent >= 0)
 
-def get_node_data(graph, df):
-    node_x = []
-    node_y = []
-    custom_data = []
-    attributes = get_attributes(df)
+    segments = np.full((children.size, 3, 2), np.nan)
+    segments[:, 0] = positions[children]
+    segments[:, 1] = positions[sub_index.parent[children]]
 
-    for node in graph.nodes():
-        x, y = graph.nodes[node]['pos']
-        node_x.append(x)
-        node_y.append(y)
+    return segments[:, :, 0].ravel(), segments[:, :, 1].ravel()
 
-        data = {"Name": graph.nodes[node]['Name']}
-        if attributes:
-            for attribute in attributes:
-                data[attribute] = graph.nodes[node][attribute]
-        custom_data.append(data)
 
-    return node_x, node_y, custom_data
+def get_node_data(node_ids, positions):
+    """
+    Return the positions and custom data of the drawn nodes. The custom data of a node is its id, the attributes
+    are looked up from MCTS data file when a node is hovered or clicked.
+    :param node_ids: sorted numpy array of the ids of drawn nodes
+    :param positions: 2-D numpy array (nodes x 2) of positions aligned with node_ids
+    :return: numpy arrays of x positions, y positions and custom data
+    """
+    return positions[:, 0], positions[:, 1], node_ids
 
 
-def get_custom_data_by_node_name(fig, node_name):
-    fig = get_figure_object(fig)
-    custom_data = fig.data[1]['customdata']
+def is_webgl_render_mode(render_mode, node_number):
+    """
+    Decide if the figure is rendered by WebGL. Auto mode uses WebGL when there are more nodes than
+    WEBGL_NODE_THRESHOLD.
+    :param render_mode: 'auto', 'svg' or 'webgl'
+    :param node_number: the number of nodes in the figure
+    :return: True or False
+    """
+    if render_mode == 'auto' or render_mode is None:
+        return node_number > WEBGL_NODE_THRESHOLD
 
-    for data in custom_data:
-        if data['Name'] == node_name:
-            return data
-    return None
+    return render_mode == 'webgl'
 
 
-def generate_fig(graph, df):
-    edge_x, edge_y = get_edge_pos(graph)
-    node_x, node_y, custom_data = get_node_data(graph, df)
+def generate_fig(df, node_ids, positions, render_mode='auto'):
+    """
+    Generate the figure of the drawn nodes. The traces are built from the columns of MCTS data file, and the i-th
+    marker of the node trace is the node node_ids[i].
+    :param df: MCTS data file
+    :param node_ids: sorted numpy array of the ids of drawn nodes
+    :param positions: 2-D numpy array (nodes x 2) of positions aligned with node_ids
+    :param render_mode: 'auto', 'svg' or 'webgl'
+    :return: Figure
+    """
+    edge_x, edge_y = get_edge_pos(df, node_ids, positions)
+    node_x, node_y, custom_data = get_node_data(node_ids, positions)
 
-    edge_trace = go.Scatter(
+    scatter = go.Scattergl if is_webgl_render_mode(render_mode, len(node_x)) else go.Scatter
+
+    edge_trace = scatter(
         x=edge_x, y=edge_y,
         line=dict(width=0.5, color='#888'),
         hoverinfo='none',
         mode='lines')
 
-    node_trace = go.Scatter(
+    node_trace = scatter(
         x=node_x, y=node_y, customdata=custom_data,
         mode='markers',
         marker=dict(
@@ -164,11 +236,11 @@ def generate_fig(graph, df):
             colorbar=dict(
                 thickness=15,
                 xanchor='left',
-                titleside='right'
+                title=dict(side='right')
             ),
             line_width=1))
 
-    node_trace.marker.color = [i['Depth'] for i in custom_data]
+    node_trace.marker.color = df['Depth'].to_numpy()[node_ids]
 
     fig = go.Figure(data=[edge_trace, node_trace],
                     layout=go.Layout(
@@ -183,38 +255,122 @@ def generate_fig(graph, df):
     return fig
 
 
-def generate_visit_threshold_network(df, threshold, legend=None, custom_symbols=None, min_visit_threshold=0):
-    df = df[df['Visits'] >= min_visit_threshold]
+def generate_visit_threshold_network(df, threshold, legend=None, custom_symbols=None, min_visit_threshold=0,
+                                     layout_engine='radial', render_mode='auto', compact=False):
+    """
+    Generate the figure of the nodes visited at least min_visit_threshold times. The nodes keep their positions in
+    the layout of the whole tree unless compact is True, then only the drawn nodes are laid out again.
+    :param df: MCTS data file
+    :param threshold: the visit threshold
+    :param legend: the name of legend attribute
+    :param custom_symbols: the list of (binary attribute, symbol) rules
+    :param min_visit_threshold: the minimum visit threshold of the figure
+    :param layout_engine: the name of layout engine
+    :param render_mode: 'auto', 'svg' or 'webgl'
+    :param compact: lay out the drawn nodes again if True
+    :return: Figure
+    """
+    node_ids = get_figure_node_ids(df, min_visit_threshold)
+
+    if compact:
+        positions = tree_layout.get_compact_layout(df, node_ids, layout_engine)
+    else:
+        positions = tree_layout.get_tree_layout(df, layout_engine)[node_ids]
+
+    fig = generate_fig(df, node_ids, positions, render_mode)
+
+    return update_node_markers(fig, df, node_ids, threshold, legend, custom_symbols)
 
-    fig = generate_fig(generate_network(df), df)
 
+def update_node_markers(fig, df, node_ids, threshold, legend=None, custom_symbols=None):
+    """
+    Apply the legend, custom symbols and visit threshold to the node trace
+    :param fig: Figure
+    :param df: MCTS data file
+    :param node_ids: the ids of nodes drawn on the figure
+    :param threshold: the visit threshold
+    :param legend: the name of legend attribute
+    :param custom_symbols: the list of (binary attribute, symbol) rules
+    :return: Figure
+    """
     if legend:
-        fig = update_legend(fig, df, legend, threshold)
+        fig = update_node_marker(fig, get_legend_marker(df, node_ids, legend, threshold))
 
-    fig = update_marker_symbols(fig, custom_symbols)
-    fig = update_opacity(fig, threshold)
+    fig = update_node_marker(fig, get_symbol_marker(df, node_ids, custom_symbols))
+    fig = update_node_marker(fig, get_opacity_marker(df, node_ids, threshold))
 
     return fig
 
 
-def update_legend(fig, df, legend_name, visit_threshold=None):
-    fig = get_figure_object(fig)
-    custom_data = fig.data[1]['customdata']
+def generate_level_of_detail_network(df, view, threshold, legend=None, custom_symbols=None, render_mode='auto'):
+    """
+    Generate the figure of the level of detail view. Aggregate nodes have a thick outline and stand for their whole
+    subtree.
+    :param df: MCTS data file
+    :param view: LevelOfDetailView
+    :param threshold: the visit threshold
+    :param legend: the name of legend attribute
+    :param custom_symbols: the list of (binary attribute, symbol) rules
+    :param render_mode: 'auto', 'svg' or 'webgl'
+    :return: Figure
+    """
+    index = tree_index.get_tree_index(df)
+    node_ids = view.node_ids
+
+    fig = generate_fig(df, node_ids, view.get_positions(index), render_mode)
+    fig = update_node_markers(fig, df, node_ids, threshold, legend, custom_symbols)
 
+    is_collapsed = view.get_collapsed(index)
+    fig.data[1].marker.line = dict(width=np.where(is_collapsed, 3, 1).tolist(),
+                                   color=np.where(is_collapsed, '#212529', '#444').tolist())
+
+    return fig
+
+
+def get_aggregate_custom_data(df, view, node_id):
+    """
+    Return the subtree totals of an aggregate node of the level of detail view
+    :param df: MCTS data file
+    :param view: LevelOfDetailView
+    :param node_id: the id of node
+    :return: dictionary of subtree totals, None if the node is not an aggregate node
+    """
+    index = tree_index.get_tree_index(df)
+    position = np.searchsorted(view.node_ids, node_id)
+
+    if position >= len(view) or view.node_ids[position] != node_id or not view.get_collapsed(index)[position]:
+        return None
+
+    totals = level_of_detail.get_subtree_totals(df)
+    return {"Subtree Nodes": int(totals.sizes[node_id]), "Subtree Visits": totals.visits[node_id].item()}
+
+
+def get_legend_marker(df, node_ids, legend_name, visit_threshold=None):
+    """
+    Return the marker properties that colour the nodes by the legend attribute. Nodes visited less than the visit
+    threshold are grey.
+    :param df: MCTS data file
+    :param node_ids: the ids of nodes drawn on the figure
+    :param legend_name: the name of legend attribute
+    :param visit_threshold: the visit threshold
+    :return: dictionary of marker properties
+    """
     _, object_type_legend_attributes = get_legend_attributes(df)
 
+    values = df[legend_name].to_numpy()[node_ids]
+    is_visible = df['Visits'].to_numpy()[node_ids] >= visit_threshold
+
     if legend_name in object_type_legend_attributes:
-        if visit_threshold:
-            df = df[df['Visits'] >= visit_threshold]
-        name_dict = {name: idx for idx, name in enumerate(df[legend_name].unique())}
+        categories = pd.unique(values[is_visible]) if visit_threshold else pd.unique(values)
+        name_dict = {name: idx for idx, name in enumerate(categories)}
         colorbar = dict(
             thickness=15,
             xanchor='left',
-            titleside='right',
+            title=dict(side='right'),
             tickvals=[i for i in list(name_dict.values())],
             ticktext=list(name_dict.keys())
         )
-        color = [name_dict[i[legend_name]] if i['Visits'] >= visit_threshold else np.nan for i in custom_data]
+        color = [name_dict[value] if visible else np.nan for value, visible in zip(values, is_visible)]
         colorscale = []
         for val, template_color in zip(list(name_dict.values()), px.colors.qualitative.Light24):
             colorscale.append([float(val) / len(name_dict), f"rgb{plotly.colors.hex_to_rgb(template_color)}"])
@@ -223,40 +379,33 @@ def update_legend(fig, df, legend_name, visit_threshold=None):
         colorbar = dict(
             thickness=15,
             xanchor='left',
-            titleside='right',
+            title=dict(side='right'),
             tickvals=None,
             ticktext=None
         )
-        color = [i[legend_name] if i['Visits'] >= visit_threshold else np.nan for i in custom_data]
+        color = [value if visible else np.nan for value, visible in zip(values.tolist(), is_visible)]
         colorscale = "bluered"
 
-    fig.data[1].update(marker={"color": color, "colorscale": colorscale, "colorbar": colorbar})
-    return fig
-
-
-def update_marker_symbols(fig, markers_list=None):
-    # update root node
-    fig = get_figure_object(fig)
-    custom_data = fig.data[1]['customdata']
+    return {"color": color, "colorscale": colorscale, "colorbar": colorbar}
 
-    symbols = []
 
-    for data in custom_data:
-        if data['Parent_Name'] == "None":
-            symbols.append("circle-x")
-            continue
+def get_symbol_marker(df, node_ids, markers_list=None):
+    """
+    Return the marker symbols of the nodes. Root node is circle-x. If a node matches several custom symbol rules,
+    the last matched rule in the list is used.
+    :param df: MCTS data file
+    :param node_ids: the ids of nodes drawn on the figure
+    :param markers_list: the list of (binary attribute, symbol) rules
+    :return: dictionary of marker properties
+    """
+    symbols = np.full(len(node_ids), "circle", dtype=object)
 
-        if markers_list:
-            has_find = False
-            for feature, symbol in markers_list[::-1]:
-                if data[feature] == 1:
-                    symbols.append(symbol)
-                    has_find = True
-                    break
-            if has_find:
-                continue
+    if markers_list:
+        # Later rules in the list overwrite earlier rules
+        for feature, symbol in markers_list:
+            symbols[df[feature].to_numpy()[node_ids] == 1] = symbol
 
-        symbols.append("circle")
+    # update root node
+    symbols[df['Parent_Name'].to_numpy()[node_ids] == "None"] = "circle-x"
 
-    fig.data[1].update(marker={"symbol": symbols})
-    return fig
+    return {"symbol": symbols.tolist()}
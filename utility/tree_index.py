@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+from utility import tree_session
+
+
+class TreeIndex:
+    """
+    Integer index of the MCTS tree. The id of a node is its row position in the MCTS data file. The children
+    of node i are child_ids[child_offsets[i]:child_offsets[i + 1]] in the row order of the MCTS data file.
+    """
+    def __init__(self, names, parent, root):
+        self.names = np.asarray(names, dtype=object)
+        self.name_to_id = dict(zip(self.names, range(len(self.names))))
+        self.parent = parent
+        self.root = root
+
+        # Build the CSR children adjacency (stable sort keeps the row order of siblings)
+        has_parent = parent >= 0
+        self.child_ids = np.flatnonzero(has_parent)[np.argsort(parent[has_parent], kind='stable')]
+        self.child_counts = np.bincount(parent[has_parent], minlength=len(parent))
+        self.child_offsets = np.concatenate([[0], np.cumsum(self.child_counts)])
+
+        # Compute the depth of every node level by level from root (-1 if the node is not connected to root)
+        self.depth = np.full(len(parent), -1, dtype=np.int64)
+        self.levels = []
+        level = np.array([root], dtype=np.int64) if root >= 0 else np.array([], dtype=np.int64)
+        while level.size:
+            self.depth[level] = len(self.levels)
+            self.levels.append(level)
+            level = self.get_children_ids(level)
+
+    @classmethod
+    def from_df(cls, df):
+        """
+        Build the tree index from the Name and Parent_Name columns
+        :param df: MCTS data file
+        :return: TreeIndex
+        """
+        error = get_structure_error(df)
+        if error:
+            raise ValueError(error)
+
+        names = pd.Index(df['Name'])
+        parent_names = df['Parent_Name']
+        parent = names.get_indexer(parent_names).astype(np.int64)
+
+        root = int(np.flatnonzero((parent_names == 'None').to_numpy())[0])
+
+        return cls(names.to_numpy(), parent, root)
+
+    def __len__(self):
+        return len(self.parent)
+
+    @property
+    def nbytes(self):
+        arrays = [self.names, self.parent, self.child_ids, self.child_counts, self.child_offsets, self.depth]
+        return sum(array.nbytes for array in arrays + self.levels)
+
+    def get_id(self, node_name):
+        return self.name_to_id[node_name]
+
+    def get_ids(self, node_names):
+        return np.fromiter((self.name_to_id[name] for name in node_names), dtype=np.int64, count=len(node_names))
+
+    def get_children(self, node_id):
+        """
+        Return the children ids of a node
+        :param node_id: the id of node
+        :return: numpy array of children ids
+        """
+        return self.child_ids[self.child_offsets[node_id]:self.child_offsets[node_id + 1]]
+
+    def get_children_ids(self, node_ids):
+        """
+        Return the children ids of all the nodes, grouped by node in the given order
+        :param node_ids: numpy array of node ids
+        :return: numpy array of children ids
+        """
+        starts = self.child_offsets[node_ids]
+        counts = self.child_counts[node_ids]
+        total = counts.sum()
+
+        if total == 0:
+            return np.array([], dtype=np.int64)
+
+        # Position of every child inside the CSR array
+        group_starts = np.cumsum(counts) - counts
+        positions = np.repeat(starts - group_starts, counts) + np.arange(total)
+        return self.child_ids[positions]
+
+
+def get_structure_error(df):
+    """
+    Check if the Name and Parent_Name columns form a tree index: the node names are unique and there is a root node
+    :param df: MCTS data file
+    :return: the error message, None if the structure is valid
+    """
+    duplicated = df['Name'][df['Name'].duplicated()]
+    if not duplicated.empty:
+        return f'the node name {duplicated.iloc[0]} is not unique'
+
+    if not (df['Parent_Name'] == 'None').any():
+        return 'there is no root node (Parent_Name is None)'
+
+    return None
+
+
+def get_tree_index(df):
+    """
+    Return the tree index of MCTS data file. It is built once for the uploaded tree.
+    :param df: MCTS data file
+    :return: TreeIndex
+    """
+    return tree_session.get_artifact(df, 'tree_index', TreeIndex.from_df)
+
+
+def get_sub_index(index, node_ids):
+    """
+    Return the tree index of a subset of the nodes. The id of a node in it is its position in node_ids, and the
+    nodes whose parent is not in the subset have no parent.
+    :param index: TreeIndex
+    :param node_ids: sorted numpy array of node ids
+    :return: TreeIndex
+    """
+    node_ids = np.asarray(node_ids, dtype=np.int64)
+    parent_ids = index.parent[node_ids]
+
+    parent = np.searchsorted(node_ids, parent_ids)
+    is_drawn = parent < len(node_ids)
+    is_drawn[is_drawn] = node_ids[parent[is_drawn]] == parent_ids[is_drawn]
+    parent = np.where(is_drawn & (parent_ids >= 0), parent, -1)
+
+    root = int(np.searchsorted(node_ids, index.root))
+    if root >= len(node_ids) or node_ids[root] != index.root:
+        root = -1
+
+    return TreeIndex(index.names[node_ids], parent, root)
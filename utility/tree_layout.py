@@ -0,0 +1,177 @@
+from functools import lru_cache
+import numpy as np
+import networkx as nx
+from utility import tree_session, tree_index, layout_cache
+
+LAYOUT_ENGINES = {
+    'radial': 'Radial',
+    'twopi': 'Graphviz (twopi)'
+}
+
+GRAPHVIZ_LAYOUT_ENGINES = ['twopi']
+
+
+@lru_cache(maxsize=None)
+def has_graphviz():
+    """
+    Check if pygraphviz is installed
+    :return: True or False
+    """
+    try:
+        import pygraphviz
+    except ImportError:
+        return False
+    return True
+
+
+def get_available_layout_engines():
+    """
+    Return the layout engines that can be used in this environment
+    :return: dictionary of engine name and its label
+    """
+    if has_graphviz():
+        return LAYOUT_ENGINES.copy()
+
+    return {engine: label for engine, label in LAYOUT_ENGINES.items() if engine not in GRAPHVIZ_LAYOUT_ENGINES}
+
+
+def get_subtree_leaf_counts(index):
+    """
+    Return the number of leaves under every node (a leaf counts itself)
+    :param index: TreeIndex
+    :return: numpy array of leaf counts
+    """
+    leaf_counts = (index.child_counts == 0).astype(np.float64)
+
+    # Accumulate the leaf counts from the deepest level up to root
+    for level in reversed(index.levels[1:]):
+        leaf_counts += np.bincount(index.parent[level], weights=leaf_counts[level], minlength=len(index))
+
+    return leaf_counts
+
+
+def get_wedge_starts(index, weights):
+    """
+    Return the start of the wedge of every node when the children share the wedge of their parent in the order of
+    siblings, and every node gets the sum of the weights under it
+    :param index: TreeIndex
+    :param weights: numpy array of the subtree weight of every node (e.g. leaf counts)
+    :return: numpy array of wedge starts in the unit of weights (root starts from 0)
+    """
+    wedge_start = np.zeros(len(index))
+
+    for level in index.levels[:-1]:
+        children = index.get_children_ids(level)
+        counts = index.child_counts[level]
+
+        # Children share the wedge of their parent in the order of siblings
+        cumulative = np.cumsum(weights[children]) - weights[children]
+        group_starts = np.cumsum(counts) - counts
+        offsets = cumulative - np.repeat(cumulative[group_starts[counts > 0]], counts[counts > 0])
+        wedge_start[children] = np.repeat(wedge_start[level], counts) + offsets
+
+    return wedge_start
+
+
+def radial_layout(index, ring_distance=1.0):
+    """
+    Radial tree layout. Every node is on the ring of its depth and gets an angular wedge proportional to the number
+    of leaves under it, so subtrees never overlap. It runs level by level on the parent and children arrays.
+    :param index: TreeIndex
+    :param ring_distance: the distance between two rings
+    :return: 2-D numpy array (nodes x 2) of positions aligned with node ids. Nodes not connected to root are NaN.
+    """
+    leaf_counts = get_subtree_leaf_counts(index)
+    wedge_start = get_wedge_starts(index, leaf_counts)
+
+    unit = 2 * np.pi / leaf_counts[index.root] if index.root >= 0 else 0
+    angles = (wedge_start + leaf_counts / 2) * unit
+    radius = np.where(index.depth >= 0, index.depth * ring_distance, np.nan)
+
+    return np.column_stack([radius * np.cos(angles), radius * np.sin(angles)])
+
+
+def graphviz_layout(graph, prog='twopi'):
+    """
+    Graphviz layout through pygraphviz
+    :param graph: networkx graph
+    :param prog: graphviz program
+    :return: dictionary of node name and position
+    """
+    return nx.nx_agraph.graphviz_layout(graph, prog=prog)
+
+
+def get_index_graph(index):
+    """
+    Return the networkx graph of the tree index (only required by graphviz engines)
+    :param index: TreeIndex
+    :return: networkx graph of node names
+    """
+    graph = nx.Graph()
+    graph.add_nodes_from(index.names)
+
+    has_parent = index.parent >= 0
+    graph.add_edges_from(zip(index.names[has_parent], index.names[index.parent[has_parent]]))
+    return graph
+
+
+def get_layout_engine(engine='radial'):
+    """
+    Return the layout engine actually used. Graphviz engines fall back to the radial layout if pygraphviz is not
+    installed.
+    :param engine: the name of layout engine
+    :return: the name of layout engine
+    """
+    if engine in GRAPHVIZ_LAYOUT_ENGINES and not has_graphviz():
+        return 'radial'
+    return engine
+
+
+def get_positions(index, engine='radial'):
+    """
+    Return the positions of the nodes by the layout engine. Graphviz engines fall back to the radial layout if
+    pygraphviz is not installed.
+    :param index: TreeIndex
+    :param engine: the name of layout engine
+    :return: 2-D numpy array (nodes x 2) of positions aligned with node ids
+    """
+    if get_layout_engine(engine) in GRAPHVIZ_LAYOUT_ENGINES:
+        positions = graphviz_layout(get_index_graph(index), engine)
+        return np.array([positions[name] for name in index.names], dtype=np.float64).reshape(-1, 2)
+
+    return radial_layout(index)
+
+
+def get_tree_layout(df, engine='radial'):
+    """
+    Return the positions of all the nodes of MCTS data file. The layout is built once per tree and engine, and the
+    figures of every visit threshold take the positions of their nodes from it. It is also kept in the layout cache
+    on disk, so reopening the same tree does not run the layout engine.
+    :param df: MCTS data file
+    :param engine: the name of layout engine
+    :return: 2-D numpy array (nodes x 2) of positions aligned with node ids
+    """
+    engine = get_layout_engine(engine)
+
+    def build(data):
+        return layout_cache.get_cached_layout(data, engine,
+                                              lambda: get_positions(tree_index.get_tree_index(data), engine))
+
+    return tree_session.get_artifact(df, ('layout', engine), build)
+
+
+def get_compact_layout(df, node_ids, engine='radial'):
+    """
+    Lay out the drawn nodes again without the space of the hidden nodes. The layout is kept in the layout cache on
+    disk.
+    :param df: MCTS data file
+    :param node_ids: sorted numpy array of the ids of drawn nodes
+    :param engine: the name of layout engine
+    :return: 2-D numpy array (nodes x 2) of positions aligned with node_ids
+    """
+    engine = get_layout_engine(engine)
+
+    def build():
+        return get_positions(tree_index.get_sub_index(tree_index.get_tree_index(df), node_ids), engine)
+
+    return layout_cache.get_cached_layout(df, engine, build, node_ids)
@@ -0,0 +1,208 @@
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from dash.exceptions import PreventUpdate
+
+MAX_SESSIONS = 8
+MAX_BYTES = 2 * 1024 ** 3
+
+
+def estimate_nbytes(obj):
+    """
+    Estimate the memory used by a cached object
+    :param obj: DataFrame, numpy array or any object exposing nbytes
+    :return: the number of bytes
+    """
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if hasattr(obj, 'nbytes'):
+        return int(obj.nbytes)
+    return sys.getsizeof(obj)
+
+
+class TreeSession:
+    """
+    The parsed MCTS data file and the artifacts derived from it. The artifacts are built on first use and
+    kept until the session is evicted. An artifact is built by one thread at a time, the other threads wait for it
+    instead of building it again.
+    """
+    def __init__(self, file_id, df):
+        self.file_id = file_id
+        self.df = df
+        self._artifacts = {}
+        self._artifact_nbytes = {}
+        self._lock = threading.RLock()
+        self.df_nbytes = estimate_nbytes(df)
+        self.artifact_nbytes = 0
+
+    @property
+    def nbytes(self):
+        return self.df_nbytes + self.artifact_nbytes
+
+    def get_artifact(self, key, builder):
+        """
+        Return the cached artifact or build it with builder(df)
+        :param key: hashable artifact key
+        :param builder: function that takes the dataframe and return the artifact
+        :return: the artifact
+        """
+        with self._lock:
+            if key not in self._artifacts:
+                self.set_artifact(key, builder(self.df))
+            return self._artifacts[key]
+
+    def set_artifact(self, key, artifact):
+        with self._lock:
+            nbytes = estimate_nbytes(artifact)
+            self.artifact_nbytes += nbytes - self._artifact_nbytes.get(key, 0)
+            self._artifacts[key] = artifact
+            self._artifact_nbytes[key] = nbytes
+
+
+class TreeSessionStore:
+    """
+    In-memory store of TreeSession keyed by file_id. The least recently used sessions are evicted once the
+    number of sessions or their total size goes beyond the limits. The store is shared by the threads of the server,
+    so every access to the sessions holds the lock.
+    """
+    def __init__(self, max_sessions=MAX_SESSIONS, max_bytes=MAX_BYTES):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __contains__(self, file_id):
+        with self._lock:
+            return file_id in self._sessions
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(session.nbytes for session in self._sessions.values())
+
+    def add(self, file_id, df):
+        with self._lock:
+            session = TreeSession(file_id, df)
+            self._sessions[file_id] = session
+            self._sessions.move_to_end(file_id)
+            self.evict()
+            return session
+
+    def get(self, file_id):
+        with self._lock:
+            if not self.touch(file_id):
+                return None
+            return self._sessions[file_id]
+
+    def touch(self, file_id):
+        """
+        Mark the session as the most recently used one, so it is the last to be evicted
+        :param file_id: the id of session
+        :return: True if the session exists
+        """
+        with self._lock:
+            if file_id not in self._sessions:
+                return False
+            self._sessions.move_to_end(file_id)
+            return True
+
+    def find(self, df):
+        """
+        Return the session that owns the dataframe object
+        :param df: dataframe
+        :return: TreeSession or None
+        """
+        with self._lock:
+            for file_id, session in self._sessions.items():
+                if session.df is df:
+                    self._sessions.move_to_end(file_id)
+                    return session
+            return None
+
+    def evict(self):
+        """
+        Remove the least recently used sessions until the store is within its limits. The most recently used
+        session is always kept.
+        """
+        with self._lock:
+            while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or
+                                               self.nbytes > self.max_bytes):
+                self._sessions.popitem(last=False)
+
+
+sessions = TreeSessionStore()
+
+
+def is_expired(data):
+    """
+    Check if the dataframe store references a session that is no longer on the server, i.e. it is evicted or the
+    server is restarted. The file needs to be loaded again.
+    :param data: the data of dataframe store
+    :return: True or False
+    """
+    return bool(data and data['file_id']) and data['file_id'] not in sessions
+
+
+def get_session(data):
+    """
+    Return the session referenced by the dataframe store
+    :param data: the data of dataframe store
+    :return: TreeSession
+    """
+    session = sessions.get(data['file_id']) if data else None
+
+    # The callback cannot be answered until the file is loaded again (see is_expired)
+    if session is None:
+        raise PreventUpdate
+
+    return session
+
+
+def get_dataframe(data):
+    """
+    Return the MCTS data file referenced by the dataframe store
+    :param data: the data of dataframe store
+    :return: MCTS data file
+    """
+    return get_session(data).df
+
+
+def get_artifact(df, key, builder):
+    """
+    Return the artifact derived from the dataframe. It is cached on the session if the dataframe belongs to one,
+    otherwise (e.g. a filtered copy of MCTS data file) it is built without caching.
+    :param df: MCTS data file
+    :param key: hashable artifact key
+    :param builder: function that takes the dataframe and return the artifact
+    :return: the artifact
+    """
+    session = sessions.find(df)
+
+    if session is None:
+        return builder(df)
+
+    artifact = session.get_artifact(key, builder)
+    sessions.evict()
+    return artifact
+
+
+def set_artifact(df, key, artifact):
+    """
+    Replace the artifact derived from the dataframe. Nothing is cached if the dataframe does not belong to a session.
+    :param df: MCTS data file
+    :param key: hashable artifact key
+    :param artifact: the artifact
+    """
+    session = sessions.find(df)
+
+    if session is None:
+        return
+
+    session.set_artifact(key, artifact)
+    sessions.evict()
@@ -0,0 +1,66 @@
+import math
+import numpy as np
+from utility import tree_session
+
+
+class VisitIndex:
+    """
+    The sorted visits of all the nodes. The number of nodes above a visit threshold and the threshold that keeps
+    at most a number of nodes are answered by binary search.
+    """
+    def __init__(self, visits):
+        self.visits = np.sort(np.asarray(visits, dtype=np.float64))
+
+    @classmethod
+    def from_df(cls, df):
+        return cls(df['Visits'].to_numpy())
+
+    def __len__(self):
+        return len(self.visits)
+
+    @property
+    def nbytes(self):
+        return self.visits.nbytes
+
+    def count_nodes(self, visit_threshold):
+        """
+        Return the number of nodes visited at least visit_threshold times
+        :param visit_threshold: visit threshold
+        :return: the number of nodes
+        """
+        return len(self.visits) - int(np.searchsorted(self.visits, visit_threshold, side='left'))
+
+    def get_max_visits(self, visit_threshold):
+        """
+        Return the maximum visits of the nodes visited at least visit_threshold times
+        :param visit_threshold: visit threshold
+        :return: the maximum visits, None if no node is left
+        """
+        if not self.count_nodes(visit_threshold):
+            return None
+        return self.visits[-1].item()
+
+    def get_min_threshold(self, max_nodes):
+        """
+        Return the smallest visit threshold (an integer from 1) that leaves at most max_nodes nodes. The threshold
+        is 1 if the tree has no more than max_nodes nodes, otherwise the nodes with no visit are also dropped and
+        the threshold is at least 2.
+        :param max_nodes: the maximum number of nodes
+        :return: visit threshold
+        """
+        max_nodes = max(int(max_nodes), 0)
+
+        if len(self.visits) <= max_nodes:
+            return 1
+
+        # The threshold has to be above the visits of the (max_nodes + 1)-th most visited node
+        return max(2, math.floor(self.visits[len(self.visits) - max_nodes - 1]) + 1)
+
+
+def get_visit_index(df):
+    """
+    Return the visit index of MCTS data file. It is built once for the uploaded tree.
+    :param df: MCTS data file
+    :return: VisitIndex
+    """
+    return tree_session.get_artifact(df, 'visit_index', VisitIndex.from_df)